@@ -0,0 +1,838 @@
+import os
+import re
+import fcntl
+import shutil
+import struct
+import ctypes
+import ctypes.util
+import json
+import atexit
+import hashlib
+import socket
+import threading
+import http.server
+import socketserver
+import random
+import time
+import pathlib
+import cProfile
+import selectors
+import subprocess
+import tempfile
+import resource
+import importlib.util
+
+from enum import Enum
+try:
+    import tomllib
+except ImportError:
+    # python < 3.11, toml config files are not supported
+    tomllib = None
+from types import ModuleType
+from typing import Callable
+
+import exceptions
+
+
+class PlayerType(Enum):
+    SQUEEZELITE = "squeezelite"
+    MPD = "mpd"
+
+
+class CrashLoopAction(Enum):
+    EXIT = "exit"
+    COOLDOWN = "cooldown"
+
+
+class SchedulingPolicy(Enum):
+    OTHER = "other"
+    BATCH = "batch"
+    IDLE = "idle"
+    FIFO = "fifo"
+    RR = "rr"
+
+    @property
+    def os_policy(self) -> int:
+        return getattr(os, f"SCHED_{self.name}")
+
+    @property
+    def realtime(self) -> bool:
+        return self in [SchedulingPolicy.FIFO, SchedulingPolicy.RR]
+
+
+def parse_cpu_set(v: str) -> set[int]:
+    """Parse a cpu list like '2', '0,2' or '0-1,4'."""
+    cpu_set: set[int] = set()
+    item: str
+    for item in v.replace(" ", "").split(","):
+        first, sep, last = item.partition("-")
+        if not first.isdigit() or (sep and not last.isdigit()) or (sep and int(last) < int(first)):
+            raise exceptions.InvalidCpuSet(f"Value [{v}] is not a valid cpu list")
+        cpu_set.update(range(int(first), int(last if sep else first) + 1))
+    return cpu_set
+
+
+def check_scheduling_priority(scheduling_policy: SchedulingPolicy, scheduling_priority: int):
+    # 1-99 for fifo and rr, 0 for the other policies
+    min_priority: int = os.sched_get_priority_min(scheduling_policy.os_policy)
+    max_priority: int = os.sched_get_priority_max(scheduling_policy.os_policy)
+    if not min_priority <= scheduling_priority <= max_priority:
+        raise exceptions.InvalidSchedulingPriority(
+            f"Priority [{scheduling_priority}] must be between [{min_priority}] and [{max_priority}] "
+            f"for policy [{scheduling_policy.value}]")
+
+
+class ProcessTuning:
+    """CPU affinity, scheduling and memory locking, applied to a player before it is executed."""
+
+    def __init__(
+            self,
+            cpu_set: set[int] = None,
+            scheduling_policy: SchedulingPolicy = None,
+            scheduling_priority: int = 0,
+            memlock: bool = False):
+        if scheduling_policy:
+            check_scheduling_priority(scheduling_policy=scheduling_policy, scheduling_priority=scheduling_priority)
+        self.__cpu_set: set[int] = cpu_set
+        self.__scheduling_policy: SchedulingPolicy = scheduling_policy
+        self.__scheduling_priority: int = scheduling_priority
+        self.__memlock: bool = memlock
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.__cpu_set or self.__scheduling_policy or self.__memlock)
+
+    def describe(self) -> str:
+        return (f"cpu set [{','.join(map(str, sorted(self.__cpu_set))) if self.__cpu_set else ''}] "
+                f"scheduling policy [{self.__scheduling_policy.value if self.__scheduling_policy else ''}] "
+                f"priority [{self.__scheduling_priority}] "
+                f"memlock [{self.__memlock}]")
+
+    def apply(self, report: Callable[[str], None] = print, pid: int = 0):
+        """Apply to the current process, or to pid, the settings are inherited through fork and exec."""
+        if self.__cpu_set:
+            try:
+                os.sched_setaffinity(pid, self.__cpu_set)
+            except OSError as e:
+                report(f"Cannot set cpu affinity to [{sorted(self.__cpu_set)}]: [{e}]")
+        if self.__scheduling_policy:
+            try:
+                os.sched_setscheduler(
+                    pid,
+                    self.__scheduling_policy.os_policy,
+                    os.sched_param(self.__scheduling_priority))
+            except OSError as e:
+                report(f"Cannot set scheduling policy [{self.__scheduling_policy.value}] "
+                       f"priority [{self.__scheduling_priority}]: [{e}]"
+                       f"{', CAP_SYS_NICE or RLIMIT_RTPRIO is required' if self.__scheduling_policy.realtime else ''}")
+        if self.__memlock:
+            # mlockall does not survive exec, so the limit is raised for the player to lock its own memory
+            try:
+                resource.prlimit(pid, resource.RLIMIT_MEMLOCK, (resource.RLIM_INFINITY, resource.RLIM_INFINITY))
+            except (OSError, ValueError) as e:
+                soft, hard = resource.prlimit(pid, resource.RLIMIT_MEMLOCK)
+                report(f"Cannot remove the memlock limit, CAP_SYS_RESOURCE is required: [{e}], "
+                       f"raising it to the hard limit [{hard}]")
+                try:
+                    resource.prlimit(pid, resource.RLIMIT_MEMLOCK, (hard, hard))
+                except (OSError, ValueError) as e:
+                    report(f"Cannot raise the memlock limit: [{e}]")
+
+    def apply_in_child(self):
+        """As preexec_fn, only in a parent without threads. Reports to stderr, stdout might be a pipe."""
+        self.apply(report=lambda x: os.write(2, f"{x}\n".encode(errors="replace")))
+
+
+def create_process_tuning(
+        cpu_affinity: str,
+        scheduling_policy: str,
+        scheduling_priority: str,
+        memlock: bool) -> ProcessTuning:
+    """Build a ProcessTuning from the values of the environment variables."""
+    policy: SchedulingPolicy = None
+    if scheduling_policy:
+        if scheduling_policy.lower() not in list(map(lambda x: x.value, SchedulingPolicy)):
+            raise exceptions.NotASchedulingPolicy(f"Value [{scheduling_policy}] is not a scheduling policy")
+        policy = SchedulingPolicy(scheduling_policy.lower())
+    priority: int = 0
+    if scheduling_priority:
+        try:
+            priority = int(scheduling_priority)
+        except ValueError:
+            raise exceptions.NotAnIntegerValue(f"Value [{scheduling_priority}] is not an integer")
+    # without a policy, the priority must fit the default one
+    check_scheduling_priority(scheduling_policy=policy or SchedulingPolicy.OTHER, scheduling_priority=priority)
+    return ProcessTuning(
+        cpu_set=parse_cpu_set(cpu_affinity) if cpu_affinity else None,
+        scheduling_policy=policy,
+        scheduling_priority=priority,
+        memlock=memlock)
+
+
+class PhaseTimer:
+    """Durations of the startup phases, emitted as a single JSON line."""
+
+    def __init__(self, runner_name: str, enabled: bool = False, profile_file: str = None):
+        self.__runner_name: str = runner_name
+        self.__enabled: bool = enabled
+        self.__profile_file: str = profile_file
+        self.__started_at: float = time.monotonic()
+        self.__last_mark: float = self.__started_at
+        self.__phases: list[tuple[str, float]] = []
+        self.__emitted: bool = False
+        self.__profiler: cProfile.Profile = None
+        if profile_file:
+            self.__profiler = cProfile.Profile()
+            self.__profiler.enable()
+
+    def mark(self, phase: str):
+        """Record the end of a phase, which started at the previous mark."""
+        if not self.__enabled:
+            return
+        now: float = time.monotonic()
+        self.__phases.append((phase, now - self.__last_mark))
+        self.__last_mark = now
+
+    def emit(self):
+        if self.__emitted:
+            return
+        self.__emitted = True
+        if self.__profiler:
+            self.__profiler.disable()
+            self.__profiler.dump_stats(self.__profile_file)
+            print(f"Profile written to [{self.__profile_file}]")
+        if self.__enabled:
+            print(json.dumps({
+                "runner": self.__runner_name,
+                "pid": os.getpid(),
+                "total_ms": round((self.__last_mark - self.__started_at) * 1000.0, 3),
+                "phases": list(map(lambda x: {"phase": x[0], "ms": round(x[1] * 1000.0, 3)}, self.__phases))}),
+                flush=True)
+
+
+class RestartPolicy:
+    """Exponential backoff with jitter, reset after a stable run, and a crash-loop breaker."""
+
+    def __init__(
+            self,
+            initial_delay: float,
+            max_delay: float,
+            backoff_factor: float = 2,
+            jitter_percent: int = 0,
+            stable_uptime: float = 0,
+            crash_loop_max_failures: int = 0,
+            crash_loop_window: float = 0,
+            crash_loop_action: CrashLoopAction = CrashLoopAction.COOLDOWN,
+            crash_loop_cooldown: float = 0,
+            random_source: Callable[[], float] = random.random):
+        self.__initial_delay: float = initial_delay
+        self.__max_delay: float = max(max_delay, initial_delay)
+        self.__backoff_factor: float = backoff_factor
+        self.__jitter_percent: int = jitter_percent
+        self.__stable_uptime: float = stable_uptime
+        self.__crash_loop_max_failures: int = crash_loop_max_failures
+        self.__crash_loop_window: float = crash_loop_window
+        self.__crash_loop_action: CrashLoopAction = crash_loop_action
+        self.__crash_loop_cooldown: float = crash_loop_cooldown
+        self.__random_source: Callable[[], float] = random_source
+        self.__attempt: int = 0
+        self.__failures: list[float] = []
+
+    @property
+    def attempt(self) -> int:
+        return self.__attempt
+
+    @property
+    def crash_loop_action(self) -> CrashLoopAction:
+        return self.__crash_loop_action
+
+    def next_delay(self, uptime: float, now: float = None, failed: bool = True) -> float:
+        """Seconds to wait before the next start, None if the crash-loop breaker gives up."""
+        now = now if now is not None else time.monotonic()
+        if uptime >= self.__stable_uptime > 0:
+            # the last run was stable, start over
+            self.__attempt = 0
+            self.__failures.clear()
+        if not failed:
+            # a clean exit is neither backed off nor counted by the crash-loop breaker
+            return self.__add_jitter(self.__initial_delay)
+        self.__failures.append(now)
+        if self.__crash_loop_window > 0:
+            self.__failures = list(filter(lambda x: now - x <= self.__crash_loop_window, self.__failures))
+        if 0 < self.__crash_loop_max_failures <= len(self.__failures):
+            self.__failures.clear()
+            self.__attempt = 0
+            if self.__crash_loop_action == CrashLoopAction.EXIT:
+                return None
+            return self.__crash_loop_cooldown
+        delay: float = min(self.__max_delay, self.__initial_delay * (self.__backoff_factor ** self.__attempt))
+        if delay < self.__max_delay:
+            # no need to keep growing once the cap is reached
+            self.__attempt += 1
+        return self.__add_jitter(delay)
+
+    def __add_jitter(self, delay: float) -> float:
+        if self.__jitter_percent > 0:
+            # spread the delay uniformly within +/- jitter_percent
+            spread: float = delay * self.__jitter_percent / 100.0
+            delay += spread * (2.0 * self.__random_source() - 1.0)
+        return max(0.0, delay)
+
+
+def write_file_atomically(file_path: pathlib.Path, content: str):
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{file_path.name}.", dir=str(file_path.parent))
+    try:
+        # mkstemp creates the file as 0600, apply the same mode open() would have used
+        umask: int = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_name, 0o666 & ~umask)
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, str(file_path))
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+    # make the rename durable
+    dir_fd: int = os.open(str(file_path.parent), os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+# ioctl that makes a file share the extents of another one, btrfs, xfs and others
+FICLONE: int = 0x40049409
+
+
+def try_hard_link(source: pathlib.Path, target: pathlib.Path) -> bool:
+    try:
+        os.link(str(source), str(target))
+        return True
+    except FileExistsError:
+        raise
+    except OSError:
+        # different filesystem, or not allowed (e.g. fs.protected_hardlinks)
+        return False
+
+
+def clone_file(source: pathlib.Path, target: pathlib.Path, allow_hardlink: bool = True) -> str:
+    """Create target with the content of source, sharing the data when the filesystem allows it.
+
+    A reflink is tried first, then a hard link, then a plain copy. Returns the method that was used.
+    """
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{target.name}.", dir=str(target.parent))
+    try:
+        umask: int = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_name, 0o666 & ~umask)
+        with os.fdopen(fd, "wb") as dst, open(str(source), "rb") as src:
+            method: str = "reflink"
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            except OSError:
+                if allow_hardlink and try_hard_link(source=source, target=target):
+                    os.unlink(tmp_name)
+                    return "hardlink"
+                shutil.copyfileobj(src, dst)
+                method = "copy"
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(tmp_name, str(target))
+        return method
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+
+
+class LogEventCounters:
+    """Counts the lines matching known patterns, keeping the last value captured by each pattern."""
+
+    def __init__(self, patterns: dict[str, str]):
+        self.__patterns: list[tuple[str, re.Pattern]] = list(map(lambda x: (x[0], re.compile(x[1])), patterns.items()))
+        self.__counters: dict[str, int] = dict(map(lambda x: (x, 0), patterns.keys()))
+        self.__last_values: dict[str, str] = {}
+        self.__changed: bool = False
+
+    @property
+    def counters(self) -> dict[str, int]:
+        return dict(self.__counters)
+
+    @property
+    def last_values(self) -> dict[str, str]:
+        return dict(self.__last_values)
+
+    def feed(self, line: str):
+        name: str
+        pattern: re.Pattern
+        for name, pattern in self.__patterns:
+            match: re.Match = pattern.search(line)
+            if match:
+                self.__counters[name] += 1
+                if match.groups():
+                    self.__last_values[name] = match.group(1)
+                self.__changed = True
+
+    def take_changed(self) -> bool:
+        """True if something was counted since the previous call."""
+        changed: bool = self.__changed
+        self.__changed = False
+        return changed
+
+
+def read_process_stats(pid: int) -> tuple[int, float]:
+    """Resident memory in bytes and cpu time in seconds of a process, None if it is gone."""
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            data: str = f.read()
+    except OSError:
+        return None
+    # the command name can contain spaces and parentheses, the fields after it start with the state
+    fields: list[str] = data[data.rindex(")") + 2:].split()
+    cpu_seconds: float = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    rss_bytes: int = int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+    return rss_bytes, cpu_seconds
+
+
+class PlayerStatus:
+    """Runs of a player, as reported in the events file and by the metrics endpoint."""
+
+    def __init__(self, player_name: str, log_events: LogEventCounters = None):
+        self.__player_name: str = player_name
+        self.__log_events: LogEventCounters = log_events
+        self.__runs: int = 0
+        self.__last_exit_code: int = None
+        self.__pid: int = None
+        self.__started_at: float = None
+        self.__spawn_duration: float = None
+
+    @property
+    def player_name(self) -> str:
+        return self.__player_name
+
+    @property
+    def runs(self) -> int:
+        return self.__runs
+
+    @property
+    def last_exit_code(self) -> int:
+        return self.__last_exit_code
+
+    @property
+    def log_events(self) -> LogEventCounters:
+        return self.__log_events
+
+    def started(self, pid: int, spawn_duration: float):
+        self.__runs += 1
+        self.__pid = pid
+        self.__started_at = time.monotonic()
+        self.__spawn_duration = spawn_duration
+
+    def terminated(self, exit_code: int):
+        self.__last_exit_code = exit_code
+        self.__pid = None
+        self.__started_at = None
+
+    def to_json(self) -> str:
+        result: dict[str, any] = {
+            "runs": self.__runs,
+            "last_exit_code": self.__last_exit_code}
+        if self.__log_events:
+            result["events"] = self.__log_events.counters
+            result["last_values"] = self.__log_events.last_values
+        return json.dumps(result)
+
+    def to_prometheus(self) -> str:
+        label: str = f"{{player=\"{self.__player_name}\"}}"
+        lines: list[str] = []
+        declared: set[str] = set()
+
+        def add(name: str, metric_type: str, help_text: str, value: any, labels: str = label):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+            lines.append(f"{name}{labels} {value}")
+
+        pid: int = self.__pid
+        started_at: float = self.__started_at
+        add("player_launcher_runs_total", "counter", "Number of times the player was started.", self.__runs)
+        add("player_launcher_restarts_total", "counter", "Number of times the player was restarted.",
+            max(0, self.__runs - 1))
+        add("player_launcher_up", "gauge", "Whether the player process is running.", 1 if pid else 0)
+        if self.__last_exit_code is not None:
+            add("player_launcher_last_exit_code", "gauge", "Exit code of the last run.", self.__last_exit_code)
+        add("player_launcher_uptime_seconds", "gauge", "Uptime of the current run.",
+            round(time.monotonic() - started_at, 3) if started_at else 0)
+        if self.__spawn_duration is not None:
+            add("player_launcher_spawn_seconds", "gauge", "Time taken to spawn the player in the last run.",
+                round(self.__spawn_duration, 6))
+        stats: tuple[int, float] = read_process_stats(pid) if pid else None
+        if stats:
+            add("player_process_resident_memory_bytes", "gauge", "Resident memory of the player.", stats[0])
+            add("player_process_cpu_seconds_total", "counter", "Cpu time of the current player process.",
+                round(stats[1], 2))
+        if self.__log_events:
+            name: str
+            count: int
+            for name, count in self.__log_events.counters.items():
+                add("player_log_events_total", "counter", "Log lines matching a known event.", count,
+                    f"{{player=\"{self.__player_name}\",event=\"{name}\"}}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path not in ["/", "/metrics"]:
+            self.send_error(404)
+            return
+        body: bytes = self.server.status.to_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self) -> str:
+        # client_address is not a tuple on unix sockets
+        return str(self.client_address[0]) if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format: str, *args):
+        # scrapes are not logged
+        pass
+
+
+class TcpMetricsServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class Tcp6MetricsServer(TcpMetricsServer):
+    address_family = socket.AF_INET6
+
+
+class UnixMetricsServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects an address tuple
+        return request, ("unix", 0)
+
+
+class MetricsServer:
+    """Serves the status of a player in the Prometheus text format, from a background thread."""
+
+    def __init__(self, address: str, status: PlayerStatus):
+        self.__address: str = address
+        self.__status: PlayerStatus = status
+        self.__socket_path: str = None
+        self.__server: socketserver.BaseServer = None
+
+    def start(self):
+        if self.__address.startswith("/") or self.__address.startswith("~"):
+            self.__socket_path = os.path.expanduser(self.__address)
+            if os.path.exists(self.__socket_path):
+                # left behind by a previous run
+                os.unlink(self.__socket_path)
+            self.__server = UnixMetricsServer(self.__socket_path, MetricsRequestHandler)
+        else:
+            # host:port, [ipv6]:port, or just :port for localhost
+            host, _, port = self.__address.rpartition(":")
+            host = host.strip("[]") or "127.0.0.1"
+            server_class: type = Tcp6MetricsServer if ":" in host else TcpMetricsServer
+            self.__server = server_class((host, int(port)), MetricsRequestHandler)
+        self.__server.status = self.__status
+        threading.Thread(target=self.__server.serve_forever, name="metrics", daemon=True).start()
+        atexit.register(self.stop)
+        print(f"Metrics available at [{self.__address}]")
+
+    def stop(self):
+        if self.__server:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__server = None
+        if self.__socket_path and os.path.exists(self.__socket_path):
+            os.unlink(self.__socket_path)
+
+
+def start_metrics_server(address: str, status: PlayerStatus) -> MetricsServer:
+    """Start serving metrics if an address (host:port or a unix socket path) is specified."""
+    if not address:
+        return None
+    metrics_server: MetricsServer = MetricsServer(address=address, status=status)
+    metrics_server.start()
+    return metrics_server
+
+
+def pump_process_output(
+        process: subprocess.Popen,
+        on_line: Callable[[int, str], None],
+        on_tick: Callable[[], None] = None,
+        tick_interval: float = 1.0):
+    """Read the stdout/stderr pipes of the process without blocking, one call of on_line per line.
+
+    The first argument of on_line is 1 for stdout and 2 for stderr. Returns when the
+    process has closed its pipes, or has terminated and there is nothing left to read.
+    """
+    selector: selectors.BaseSelector = selectors.DefaultSelector()
+    pending: dict[int, bytes] = {}
+    stream: any
+    fd_no: int
+    for stream, fd_no in [(process.stdout, 1), (process.stderr, 2)]:
+        if stream:
+            os.set_blocking(stream.fileno(), False)
+            selector.register(stream, selectors.EVENT_READ, fd_no)
+            pending[fd_no] = b""
+    try:
+        while selector.get_map():
+            events: list = selector.select(timeout=tick_interval)
+            for key, _ in events:
+                try:
+                    data: bytes = os.read(key.fileobj.fileno(), 65536)
+                except BlockingIOError:
+                    continue
+                if not data:
+                    selector.unregister(key.fileobj)
+                    if pending[key.data]:
+                        on_line(key.data, pending[key.data].decode(errors="replace"))
+                    continue
+                lines: list[bytes] = (pending[key.data] + data).split(b"\n")
+                # the last element is an incomplete line, or empty
+                pending[key.data] = lines.pop()
+                line: bytes
+                for line in lines:
+                    on_line(key.data, line.decode(errors="replace").rstrip("\r"))
+            if on_tick:
+                on_tick()
+            if not events and process.poll() is not None:
+                # a child of the process might keep the pipes open
+                break
+    finally:
+        selector.close()
+
+
+# inotify events of a directory entry: written and closed, modified, renamed, created, deleted
+INOTIFY_MASK: int = 0x8 | 0x2 | 0x40 | 0x80 | 0x100 | 0x200
+INOTIFY_EVENT_HEADER: struct.Struct = struct.Struct("iIII")
+
+
+class FileWatcher:
+    """Tells whether some files changed since the last call.
+
+    Uses inotify on the parent directories, so that files replaced by a rename (as most editors do)
+    are noticed. When inotify is not available, the stat of the files is compared instead.
+    """
+
+    def __init__(self, file_names: list[str]):
+        self.__paths: list[pathlib.Path] = list(map(
+            lambda x: pathlib.Path(os.path.expanduser(x)).absolute(),
+            file_names))
+        self.__signatures: dict[pathlib.Path, tuple] = dict(map(lambda x: (x, self.__signature(x)), self.__paths))
+        self.__inotify_fd: int = None
+        self.__names_by_wd: dict[int, set[str]] = {}
+        try:
+            self.__start_inotify()
+        except (OSError, AttributeError):
+            self.close()
+
+    @property
+    def method(self) -> str:
+        return "inotify" if self.__inotify_fd is not None else "poll"
+
+    @staticmethod
+    def __signature(path: pathlib.Path) -> tuple:
+        try:
+            st: os.stat_result = os.stat(path)
+            return (st.st_ino, st.st_size, st.st_mtime_ns)
+        except OSError:
+            return None
+
+    def __start_inotify(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd: int = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.__inotify_fd = fd
+        directory: pathlib.Path
+        for directory in set(map(lambda x: x.parent, self.__paths)):
+            wd: int = libc.inotify_add_watch(fd, str(directory).encode(), INOTIFY_MASK)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for [{directory}]")
+            self.__names_by_wd[wd] = set(map(lambda x: x.name, filter(lambda x: x.parent == directory, self.__paths)))
+
+    def __inotify_events(self) -> bool:
+        found: bool = False
+        while True:
+            try:
+                data: bytes = os.read(self.__inotify_fd, 65536)
+            except BlockingIOError:
+                return found
+            offset: int = 0
+            while offset < len(data):
+                wd, _, _, name_length = INOTIFY_EVENT_HEADER.unpack_from(data, offset)
+                offset += INOTIFY_EVENT_HEADER.size
+                name: str = data[offset:offset + name_length].rstrip(b"\0").decode(errors="replace")
+                offset += name_length
+                if name in self.__names_by_wd.get(wd, set()):
+                    found = True
+
+    def changed(self) -> bool:
+        if self.__inotify_fd is not None and not self.__inotify_events():
+            return False
+        # a save can produce many events, possibly across two calls, report it once
+        current: dict[pathlib.Path, tuple] = dict(map(lambda x: (x, self.__signature(x)), self.__paths))
+        if current == self.__signatures:
+            return False
+        self.__signatures = current
+        return True
+
+    def close(self):
+        if self.__inotify_fd is not None:
+            os.close(self.__inotify_fd)
+            self.__inotify_fd = None
+
+
+def read_meminfo() -> dict[str, int]:
+    """Values of /proc/meminfo in kB, empty if not available."""
+    result: dict[str, int] = {}
+    try:
+        with open("/proc/meminfo", "r") as f:
+            line: str
+            for line in f:
+                key, _, value = line.partition(":")
+                fields: list[str] = value.split()
+                if fields and fields[0].isdigit():
+                    result[key.strip()] = int(fields[0])
+    except OSError:
+        pass
+    return result
+
+
+def read_config_file(file_name: str) -> tuple[bytes, dict[str, any]]:
+    """Raw content and parsed data of a toml or json config file."""
+    with open(os.path.expanduser(file_name), "rb") as f:
+        content: bytes = f.read()
+    try:
+        if file_name.lower().endswith(".toml"):
+            if not tomllib:
+                raise exceptions.InvalidConfigFile(file_name, ["toml requires python 3.11 or later, use json"])
+            return content, tomllib.loads(content.decode("utf-8"))
+        return content, json.loads(content)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise exceptions.InvalidConfigFile(file_name, [str(e)])
+
+
+def config_value_to_str(v: any) -> str:
+    """Scalar values of a config file as they would be written in the environment, None if not a scalar."""
+    if isinstance(v, bool):
+        return "yes" if v else "no"
+    if isinstance(v, (int, float, str)):
+        return str(v)
+    return None
+
+
+def get_launcher_cache_directory() -> pathlib.Path:
+    return pathlib.Path(os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "player-launchers")
+
+
+def load_config_file(
+        file_name: str,
+        schema_name: str,
+        validate: Callable[[dict[str, any], list[str]], dict[str, str]]) -> dict[str, str]:
+    """Variables defined by a config file, validated once and then cached by content hash.
+
+    The validate function converts the parsed data to variables, appending the errors to the list
+    instead of raising at the first one.
+    """
+    content, data = read_config_file(file_name)
+    h = hashlib.sha256()
+    h.update(schema_name.encode("utf-8") + b"\0" + content)
+    cache_file: pathlib.Path = get_launcher_cache_directory().joinpath(f"config-{h.hexdigest()}.json")
+    try:
+        with open(str(cache_file), "r") as f:
+            print(f"Config file [{file_name}] already validated, using [{cache_file}]")
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+    errors: list[str] = []
+    variables: dict[str, str] = validate(data, errors)
+    if errors:
+        raise exceptions.InvalidConfigFile(file_name, errors)
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        write_file_atomically(file_path=cache_file, content=json.dumps(variables))
+    except OSError as e:
+        print(f"Cannot cache the validated config file: [{e}]")
+    return variables
+
+
+def apply_config_variables(variables: dict[str, str], environ: dict[str, str] = None):
+    """Variables already in the environment win over the ones from the config file."""
+    target: dict[str, str] = environ if environ is not None else os.environ
+    k: str
+    v: str
+    for k, v in variables.items():
+        target.setdefault(k, v)
+
+
+def parse_env_file(file_name: str) -> dict[str, str]:
+    """Read a file in the format used by systemd EnvironmentFile."""
+    result: dict[str, str] = {}
+    with open(file_name, "r") as f:
+        line: str
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#") or line.startswith(";") or "=" not in line:
+                continue
+            key, value = line.split("=", 1)
+            key = key.strip()
+            if key.startswith("export "):
+                key = key[len("export "):].strip()
+            value = value.strip()
+            if len(value) >= 2 and value[0] == value[-1] and value[0] in ["\"", "'"]:
+                value = value[1:-1]
+            result[key] = value
+    return result
+
+
+def get_player_type(environ: dict[str, str]) -> PlayerType:
+    player_type: str = environ.get("PLAYER_TYPE")
+    if player_type:
+        return PlayerType(player_type.lower())
+    # squeezelite files are recognizable by their variables
+    if any(map(lambda x: x.startswith("SQUEEZELITE_"), environ.keys())):
+        return PlayerType.SQUEEZELITE
+    return PlayerType.MPD
+
+
+_source_hashes: dict[str, str] = {}
+
+
+def get_runner_source_hash(file_name: str) -> str:
+    """Hash of the source of a runner and of the shared modules, computed once per process."""
+    if file_name not in _source_hashes:
+        h = hashlib.sha256()
+        name: str
+        for name in [file_name, "common.py", "exceptions.py"]:
+            with open(get_runner_path(name), "rb") as f:
+                h.update(f.read())
+        _source_hashes[file_name] = h.hexdigest()
+    return _source_hashes[file_name]
+
+
+def get_runner_path(file_name: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), file_name)
+
+
+def load_runner_module(file_name: str) -> ModuleType:
+    """Load one of the runner scripts (e.g. sq-runner.py) as a module."""
+    module_name: str = os.path.splitext(file_name)[0].replace("-", "_")
+    spec = importlib.util.spec_from_file_location(module_name, get_runner_path(file_name))
+    module: ModuleType = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
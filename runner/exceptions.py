@@ -4,3 +4,30 @@ class NotYesNoOrEmpty(Exception):
 
 class NotAnIntegerValue(Exception):
     pass
+
+
+class NotACrashLoopAction(Exception):
+    pass
+
+
+class BinaryNotFound(Exception):
+    pass
+
+
+class NotASchedulingPolicy(Exception):
+    pass
+
+
+class InvalidCpuSet(Exception):
+    pass
+
+
+class InvalidSchedulingPriority(Exception):
+    pass
+
+
+class InvalidConfigFile(Exception):
+
+    def __init__(self, file_name: str, errors: list[str]):
+        super().__init__(f"Invalid config file [{file_name}]:\n" + "\n".join(map(lambda x: f"  {x}", errors)))
+        self.errors: list[str] = errors
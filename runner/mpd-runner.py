@@ -1,15 +1,31 @@
 #!/usr/bin/env python3
 
 import os
+import io
+import re
+import sys
+import time
+import shlex
+import signal
+import threading
+import socket
+import hashlib
+import stat
 import pathlib
 import subprocess
 
 from typing import Callable
 from enum import Enum
 
+import common
 import exceptions
 
 
+# bump when the rendering of mpd.conf changes, so that cached configurations are rendered again,
+# the source of the runner is part of the render hash too, so changes are never missed
+CONFIG_SCHEMA_VERSION: str = "2"
+
+
 class RequiredVariable(Exception):
     pass
 
@@ -34,6 +50,14 @@ class NotARunningMode(Exception):
     pass
 
 
+class NotASize(Exception):
+    pass
+
+
+class NotALogTarget(Exception):
+    pass
+
+
 class _FunctionProxy:
     """Allow to mask a function as an Object."""
     def __init__(self, function):
@@ -92,6 +116,9 @@ class Validator(Enum):
     YES_NO_OR_EMPTY = _FunctionProxy(lambda x: yes_no_or_empty(x))
     MUST_BE_OUTPUT_TYPE = _FunctionProxy(lambda x: must_be_output_type(x))
     MUST_BE_RUNNING_MODE = _FunctionProxy(lambda x: must_be_running_mode(x))
+    MUST_BE_SIZE = _FunctionProxy(lambda x: must_be_size(x))
+    MUST_BE_LOG_TARGET = _FunctionProxy(lambda x: must_be_log_target(x))
+    MUST_BE_CRASH_LOOP_ACTION = _FunctionProxy(lambda x: must_be_crash_loop_action(x))
 
 
 class MpdRunningModeData:
@@ -126,6 +153,11 @@ class MpdRunningMode(Enum):
         return self.value.command_line_switch
 
 
+class LogTarget(Enum):
+    FILE = "file"
+    SYSLOG = "syslog"
+
+
 class MpdConfKey(Enum):
     MUSIC_DIRECTORY = "music_directory"
     PLAYLIST_DIRECTORY = "playlist_directory"
@@ -142,6 +174,11 @@ class MpdConfKey(Enum):
     SAMPLERATE_CONVERTER = "samplerate_converter"
     FILESYSTEM_CHARSET = "filesystem_charset"
     AUDIO_BUFFER_SIZE = "audio_buffer_size"
+    MAX_CONNECTIONS = "max_connections"
+    MAX_OUTPUT_BUFFER_SIZE = "max_output_buffer_size"
+    MAX_PLAYLIST_LENGTH = "max_playlist_length"
+    CONNECTION_TIMEOUT = "connection_timeout"
+    MAX_COMMAND_LIST_SIZE = "max_command_list_size"
     OUTPUT_NAME = "name"
     OUTPUT_ENABLED = "enabled"
     OUTPUT_DEVICE = "device"
@@ -192,6 +229,18 @@ class MpdConfKey(Enum):
     SOXR_STOPBAND_BEGIN = "stopband_begin"
     SOXR_ATTENUATION = "attenuation"
     SOXR_FLAGS = "flags"
+    PROXY_HOST = "host"
+    PROXY_PORT = "port"
+    PROXY_PASSWORD = "password"
+    PROXY_KEEPALIVE = "keepalive"
+    CURL_PROXY = "proxy"
+    CURL_PROXY_USER = "proxy_user"
+    CURL_PROXY_PASSWORD = "proxy_password"
+    CURL_VERIFY_PEER = "verify_peer"
+    CURL_VERIFY_HOST = "verify_host"
+    CURL_CACERT = "cacert"
+    CURL_CONNECT_TIMEOUT = "connect_timeout"
+    INPUT_CACHE_SIZE = "size"
     PLUGIN_ENABLED = "enabled"
 
 
@@ -213,11 +262,33 @@ class EnvironmentVariable(Enum):
         default_value="yes",
         validator=Validator.YES_NO_OR_EMPTY.value)
     DB_FILE = EnvironmentVariableData(default_value="tag_cache")
+    DB_TEMPLATE_FILE = EnvironmentVariableData()
+    DB_TEMPLATE_MAX_AGE = EnvironmentVariableData(
+        default_value="168",
+        validator=Validator.MUST_BE_INT.value)
+    DB_TEMPLATE_HARDLINK = EnvironmentVariableData(
+        default_value="yes",
+        validator=Validator.YES_NO_OR_EMPTY.value)
     LOG_LEVEL = EnvironmentVariableData(
         default_value="notice",
         mpd_conf_key=MpdConfKey.LOG_LEVEL.value)
     ENABLE_LOG_FILE = EnvironmentVariableData(default_value="yes")
     LOG_FILE_NAME = EnvironmentVariableData(default_value="mpd.log")
+    LOG_TARGET = EnvironmentVariableData(
+        default_value=LogTarget.FILE.value,
+        validator=Validator.MUST_BE_LOG_TARGET.value)
+    # log maintenance, only while the runner stays resident
+    LOG_MAX_SIZE = EnvironmentVariableData(validator=Validator.MUST_BE_SIZE.value)
+    LOG_ROTATE_COUNT = EnvironmentVariableData(
+        default_value="1",
+        validator=Validator.MUST_BE_INT.value)
+    LOG_CHECK_INTERVAL = EnvironmentVariableData(
+        default_value="60",
+        validator=Validator.MUST_BE_INT.value)
+    LOG_FLUSH_DIRECTORY = EnvironmentVariableData()
+    LOG_FLUSH_INTERVAL = EnvironmentVariableData(
+        default_value="300",
+        validator=Validator.MUST_BE_INT.value)
     PID_FILE = EnvironmentVariableData(mpd_conf_key=MpdConfKey.PID_FILE.value)
     ENABLE_STICKER_FILE = EnvironmentVariableData(
         default_value="yes",
@@ -246,6 +317,26 @@ class EnvironmentVariable(Enum):
         default_value="yes",
         validator=Validator.YES_NO_OR_EMPTY.value,
         mpd_conf_key=MpdConfKey.PLUGIN_ENABLED.value)
+    INPUT_CURL_PROXY = EnvironmentVariableData(mpd_conf_key=MpdConfKey.CURL_PROXY.value)
+    INPUT_CURL_PROXY_USER = EnvironmentVariableData(mpd_conf_key=MpdConfKey.CURL_PROXY_USER.value)
+    INPUT_CURL_PROXY_PASSWORD = EnvironmentVariableData(mpd_conf_key=MpdConfKey.CURL_PROXY_PASSWORD.value)
+    INPUT_CURL_VERIFY_PEER = EnvironmentVariableData(
+        mpd_conf_key=MpdConfKey.CURL_VERIFY_PEER.value,
+        validator=Validator.YES_NO_OR_EMPTY.value)
+    INPUT_CURL_VERIFY_HOST = EnvironmentVariableData(
+        mpd_conf_key=MpdConfKey.CURL_VERIFY_HOST.value,
+        validator=Validator.YES_NO_OR_EMPTY.value)
+    INPUT_CURL_CACERT = EnvironmentVariableData(mpd_conf_key=MpdConfKey.CURL_CACERT.value)
+    INPUT_CURL_CONNECT_TIMEOUT = EnvironmentVariableData(
+        mpd_conf_key=MpdConfKey.CURL_CONNECT_TIMEOUT.value,
+        validator=Validator.MUST_BE_INT.value)
+    # prefetch of the input streams, e.g. "256 MB"
+    INPUT_CACHE_SIZE = EnvironmentVariableData(
+        mpd_conf_key=MpdConfKey.INPUT_CACHE_SIZE.value,
+        validator=Validator.MUST_BE_SIZE.value)
+    INPUT_CACHE_MAX_MEMORY_PERCENT = EnvironmentVariableData(
+        default_value="25",
+        validator=Validator.MUST_BE_INT.value)
     SAMPLERATE_CONVERTER = EnvironmentVariableData(mpd_conf_key=MpdConfKey.SAMPLERATE_CONVERTER.value)
     # opus decoder, might have issues for streaming,
     # so we disable it by default (ffmpeg should replace its functionality)
@@ -284,9 +375,27 @@ class EnvironmentVariable(Enum):
         mpd_conf_key=MpdConfKey.PLUGIN_ENABLED.value)
     # other stuff
     AUDIO_BUFFER_SIZE = EnvironmentVariableData(
-        default_value="no",
         validator=Validator.MUST_BE_INT.value,
         mpd_conf_key=MpdConfKey.AUDIO_BUFFER_SIZE.value)
+    # client limits, mpd defaults apply when not set
+    MAX_CONNECTIONS = EnvironmentVariableData(
+        validator=Validator.MUST_BE_INT.value,
+        mpd_conf_key=MpdConfKey.MAX_CONNECTIONS.value)
+    MAX_OUTPUT_BUFFER_SIZE = EnvironmentVariableData(
+        validator=Validator.MUST_BE_INT.value,
+        mpd_conf_key=MpdConfKey.MAX_OUTPUT_BUFFER_SIZE.value)
+    MAX_PLAYLIST_LENGTH = EnvironmentVariableData(
+        validator=Validator.MUST_BE_INT.value,
+        mpd_conf_key=MpdConfKey.MAX_PLAYLIST_LENGTH.value)
+    CONNECTION_TIMEOUT = EnvironmentVariableData(
+        validator=Validator.MUST_BE_INT.value,
+        mpd_conf_key=MpdConfKey.CONNECTION_TIMEOUT.value)
+    MAX_COMMAND_LIST_SIZE = EnvironmentVariableData(
+        validator=Validator.MUST_BE_INT.value,
+        mpd_conf_key=MpdConfKey.MAX_COMMAND_LIST_SIZE.value)
+    LIMITS_MAX_MEMORY_PERCENT = EnvironmentVariableData(
+        default_value="25",
+        validator=Validator.MUST_BE_INT.value)
     FILESYSTEM_CHARSET = EnvironmentVariableData(
         default_value="UTF-8",
         mpd_conf_key=MpdConfKey.FILESYSTEM_CHARSET.value)
@@ -299,6 +408,60 @@ class EnvironmentVariable(Enum):
     MPD_RUN_WITH_VERBOSE = EnvironmentVariableData(
         default_value="no",
         validator=Validator.YES_NO_OR_EMPTY.value)
+    MPD_EXEC_IN_PLACE = EnvironmentVariableData(
+        default_value="no",
+        validator=Validator.YES_NO_OR_EMPTY.value)
+    MPD_METRICS_ADDRESS = EnvironmentVariableData()
+    MPD_CPU_AFFINITY = EnvironmentVariableData()
+    MPD_SCHED_POLICY = EnvironmentVariableData()
+    MPD_SCHED_PRIORITY = EnvironmentVariableData(validator=Validator.MUST_BE_INT.value)
+    MPD_MEMLOCK = EnvironmentVariableData(
+        default_value="no",
+        validator=Validator.YES_NO_OR_EMPTY.value)
+    MPD_WAIT_READY = EnvironmentVariableData(
+        default_value="no",
+        validator=Validator.YES_NO_OR_EMPTY.value)
+    MPD_READY_TIMEOUT = EnvironmentVariableData(
+        default_value="30",
+        validator=Validator.MUST_BE_INT.value)
+    # executed in order once mpd accepts connections
+    MPD_POST_START_COMMAND = IndexedEnvironmentVariableData()
+    # restart policy, only used when mpd is supervised by multi-runner
+    MPD_RESTART_DELAY = EnvironmentVariableData(
+        default_value="3",
+        validator=Validator.MUST_BE_INT.value)
+    MPD_RESTART_MAX_DELAY = EnvironmentVariableData(
+        default_value="60",
+        validator=Validator.MUST_BE_INT.value)
+    MPD_RESTART_BACKOFF_FACTOR = EnvironmentVariableData(
+        default_value="2",
+        validator=Validator.MUST_BE_INT.value)
+    MPD_RESTART_JITTER = EnvironmentVariableData(
+        default_value="20",
+        validator=Validator.MUST_BE_INT.value)
+    MPD_RESTART_STABLE_UPTIME = EnvironmentVariableData(
+        default_value="60",
+        validator=Validator.MUST_BE_INT.value)
+    MPD_CRASH_LOOP_MAX_FAILURES = EnvironmentVariableData(
+        default_value="10",
+        validator=Validator.MUST_BE_INT.value)
+    MPD_CRASH_LOOP_WINDOW = EnvironmentVariableData(
+        default_value="300",
+        validator=Validator.MUST_BE_INT.value)
+    MPD_CRASH_LOOP_ACTION = EnvironmentVariableData(
+        default_value=common.CrashLoopAction.COOLDOWN.value,
+        validator=Validator.MUST_BE_CRASH_LOOP_ACTION.value)
+    MPD_CRASH_LOOP_COOLDOWN = EnvironmentVariableData(
+        default_value="600",
+        validator=Validator.MUST_BE_INT.value)
+    LAUNCHER_TIMING = EnvironmentVariableData(
+        default_value="no",
+        validator=Validator.YES_NO_OR_EMPTY.value)
+    LAUNCHER_PROFILE_FILE = EnvironmentVariableData()
+    LAUNCHER_CONFIG_FILE = EnvironmentVariableData()
+    ENABLE_CONFIG_CACHE = EnvironmentVariableData(
+        default_value="yes",
+        validator=Validator.YES_NO_OR_EMPTY.value)
     # outputs
     OUTPUT_CREATE = IndexedEnvironmentVariableData()
     # most likely people will want to create an alsa output
@@ -331,6 +494,9 @@ class EnvironmentVariable(Enum):
         mpd_conf_key=MpdConfKey.OUTPUT_PERIOD_TIME.value)
     OUTPUT_DEFAULT_FORMAT = IndexedEnvironmentVariableData(
         mpd_conf_key=MpdConfKey.OUTPUT_DEFAULT_FORMAT.value)
+    # alsa latency planner, used to calculate buffer_time and period_time
+    OUTPUT_TARGET_LATENCY = IndexedEnvironmentVariableData(validator=Validator.MUST_BE_INT.value)
+    OUTPUT_PERIOD_COUNT = IndexedEnvironmentVariableData(validator=Validator.MUST_BE_INT.value)
     OUTPUT_STOP_DSD_SILENCE = IndexedEnvironmentVariableData(
         mpd_conf_key=MpdConfKey.OUTPUT_STOP_DSD_SILENCE.value,
         validator=Validator.YES_NO_OR_EMPTY.value)
@@ -387,6 +553,18 @@ class EnvironmentVariable(Enum):
     SOXR_STOPBAND_BEGIN = EnvironmentVariableData(mpd_conf_key=MpdConfKey.SOXR_STOPBAND_BEGIN.value)
     SOXR_ATTENUATION = EnvironmentVariableData(mpd_conf_key=MpdConfKey.SOXR_ATTENUATION.value)
     SOXR_FLAGS = EnvironmentVariableData(mpd_conf_key=MpdConfKey.SOXR_FLAGS.value)
+    # the library database of another mpd instance, replaces the db file
+    DATABASE_PROXY_CREATE = EnvironmentVariableData(
+        default_value="no",
+        validator=Validator.YES_NO_OR_EMPTY.value)
+    PROXY_HOST = EnvironmentVariableData(mpd_conf_key=MpdConfKey.PROXY_HOST.value)
+    PROXY_PORT = EnvironmentVariableData(
+        mpd_conf_key=MpdConfKey.PROXY_PORT.value,
+        validator=Validator.MUST_BE_INT.value)
+    PROXY_PASSWORD = EnvironmentVariableData(mpd_conf_key=MpdConfKey.PROXY_PASSWORD.value)
+    PROXY_KEEPALIVE = EnvironmentVariableData(
+        mpd_conf_key=MpdConfKey.PROXY_KEEPALIVE.value,
+        validator=Validator.YES_NO_OR_EMPTY.value)
 
     @property
     def indexed(self) -> bool:
@@ -419,6 +597,7 @@ class PluginCategory(Enum):
     RESAMPLER = PluginCategoryData(plugin_category_name="resampler")
     DECODER = PluginCategoryData(plugin_category_name="decoder")
     INPUT = PluginCategoryData(plugin_category_name="input")
+    DATABASE = PluginCategoryData(plugin_category_name="database")
 
     @property
     def plugin_category_name(self) -> str:
@@ -460,6 +639,13 @@ class OpusPluginProperty(PluginProperty):
 
 class CurlPluginProperty(PluginProperty):
     ENABLED = PluginPropertyData(EnvironmentVariable.INPUT_CURL_ENABLED)
+    PROXY = PluginPropertyData(EnvironmentVariable.INPUT_CURL_PROXY)
+    PROXY_USER = PluginPropertyData(EnvironmentVariable.INPUT_CURL_PROXY_USER)
+    PROXY_PASSWORD = PluginPropertyData(EnvironmentVariable.INPUT_CURL_PROXY_PASSWORD)
+    VERIFY_PEER = PluginPropertyData(EnvironmentVariable.INPUT_CURL_VERIFY_PEER)
+    VERIFY_HOST = PluginPropertyData(EnvironmentVariable.INPUT_CURL_VERIFY_HOST)
+    CACERT = PluginPropertyData(EnvironmentVariable.INPUT_CURL_CACERT)
+    CONNECT_TIMEOUT = PluginPropertyData(EnvironmentVariable.INPUT_CURL_CONNECT_TIMEOUT)
 
 
 class SoxrPluginProperty(PluginProperty):
@@ -473,6 +659,13 @@ class SoxrPluginProperty(PluginProperty):
     SOXR_FLAGS = PluginPropertyData(EnvironmentVariable.SOXR_FLAGS)
 
 
+class ProxyPluginProperty(PluginProperty):
+    PROXY_HOST = PluginPropertyData(EnvironmentVariable.PROXY_HOST)
+    PROXY_PORT = PluginPropertyData(EnvironmentVariable.PROXY_PORT)
+    PROXY_PASSWORD = PluginPropertyData(EnvironmentVariable.PROXY_PASSWORD)
+    PROXY_KEEPALIVE = PluginPropertyData(EnvironmentVariable.PROXY_KEEPALIVE)
+
+
 class PluginCategoryData:
 
     def __init__(
@@ -534,6 +727,11 @@ class PluginType(Enum):
         plugin_category=PluginCategory.INPUT,
         enum_type=CurlPluginProperty,
         create_env_var=EnvironmentVariable.INPUT_CURL_CREATE)
+    PROXY = PluginCategoryData(
+        plugin_type_name="proxy",
+        plugin_category=PluginCategory.DATABASE,
+        enum_type=ProxyPluginProperty,
+        create_env_var=EnvironmentVariable.DATABASE_PROXY_CREATE)
 
     @property
     def plugin_type_name(self) -> str:
@@ -625,6 +823,10 @@ class NullOutputProperty(OutputProperty):
     OUTPUT_SYNC = OutputPropertyData(EnvironmentVariable.OUTPUT_SYNC)
 
 
+DEFAULT_ALSA_PERIOD_COUNT: int = 4
+MIN_ALSA_PERIOD_COUNT: int = 2
+
+
 class ValidatorName:
 
     def __init__(self, validator_name: str):
@@ -662,12 +864,6 @@ class OutputValidatorData:
         return self.__validator
 
 
-def dummy_validator(properties: dict[str, str]) -> ValidationResult:
-    return ValidationResult(
-        success=True,
-        error_message_provider=lambda x: f"Error while executing validator [{x.validator_name}]")
-
-
 class OutputValidator(Enum):
 
     @property
@@ -675,9 +871,132 @@ class OutputValidator(Enum):
         return self.value.output_validator
 
 
+def get_positive_int(properties: dict[str, str], key: str) -> int:
+    v: str = properties.get(key)
+    return int(v) if v and v.isdigit() and int(v) > 0 else None
+
+
+def alsa_buffer_period_validator(properties: dict[str, str]) -> ValidationResult:
+    buffer_key: str = MpdConfKey.OUTPUT_BUFFER_TIME.value
+    period_key: str = MpdConfKey.OUTPUT_PERIOD_TIME.value
+    error: str = None
+    k: str
+    for k in [buffer_key, period_key]:
+        if properties.get(k) and not get_positive_int(properties, k):
+            error = f"{k} [{properties.get(k)}] must be a positive number of microseconds"
+    buffer_time: int = get_positive_int(properties, buffer_key)
+    period_time: int = get_positive_int(properties, period_key)
+    if not error and buffer_time and period_time and buffer_time < MIN_ALSA_PERIOD_COUNT * period_time:
+        error = (f"{buffer_key} [{buffer_time}] must hold at least [{MIN_ALSA_PERIOD_COUNT}] "
+                 f"periods of [{period_time}]")
+    return ValidationResult(
+        success=error is None,
+        error_message_provider=lambda x: f"Validator [{x.validator_name}]: {error}")
+
+
 class AlsaOutputValidator(OutputValidator):
-    # Just a placeholder/example here
-    DUMMY_VALIDATOR = OutputValidatorData(dummy_validator)
+    BUFFER_PERIOD_VALIDATOR = OutputValidatorData(alsa_buffer_period_validator)
+
+
+class AudioFormat:
+
+    def __init__(self, sample_rate: int, bytes_per_sample: int, channels: int):
+        self.__sample_rate: int = sample_rate
+        self.__bytes_per_sample: int = bytes_per_sample
+        self.__channels: int = channels
+
+    @property
+    def sample_rate(self) -> int:
+        return self.__sample_rate
+
+    @property
+    def bytes_per_sample(self) -> int:
+        return self.__bytes_per_sample
+
+    @property
+    def channels(self) -> int:
+        return self.__channels
+
+    @property
+    def bytes_per_frame(self) -> int:
+        return self.__bytes_per_sample * self.__channels
+
+    def __str__(self) -> str:
+        return f"{self.__sample_rate}:{self.__bytes_per_sample * 8}:{self.__channels}"
+
+
+DEFAULT_AUDIO_FORMAT: AudioFormat = AudioFormat(sample_rate=44100, bytes_per_sample=2, channels=2)
+
+
+def parse_audio_format(v: str) -> AudioFormat:
+    # e.g. 44100:16:2, 192000:f:2, *:24:*, dsd64:2, dsd128:2=dop (as in allowed_formats)
+    fields: list[str] = v.split("=")[0].strip().split(":")
+    if len(fields) == 2 and fields[0].lower().startswith("dsd") and fields[0][3:].isdigit():
+        # mpd handles dsd as 8 bit samples at 1/8 of the dsd rate
+        return AudioFormat(
+            sample_rate=int(fields[0][3:]) * 44100 // 8,
+            bytes_per_sample=1,
+            channels=int(fields[1]) if fields[1].isdigit() else DEFAULT_AUDIO_FORMAT.channels)
+    if len(fields) != 3:
+        return None
+    rate, bits, channels = fields
+    # 24 bit samples are handled padded to 32 bit
+    bytes_by_bits: dict[str, int] = {"8": 1, "16": 2, "24": 4, "32": 4, "f": 4}
+    return AudioFormat(
+        sample_rate=int(rate) if rate.isdigit() else DEFAULT_AUDIO_FORMAT.sample_rate,
+        bytes_per_sample=bytes_by_bits.get(bits.lower(), DEFAULT_AUDIO_FORMAT.bytes_per_sample),
+        channels=int(channels) if channels.isdigit() else DEFAULT_AUDIO_FORMAT.channels)
+
+
+def get_planning_format(properties: dict[str, str]) -> AudioFormat:
+    # the format with the highest data rate is the worst case
+    candidates: list[str] = []
+    key: str
+    for key in [
+            MpdConfKey.OUTPUT_FORMAT.value,
+            MpdConfKey.OUTPUT_DEFAULT_FORMAT.value,
+            MpdConfKey.OUTPUT_ALLOWED_FORMATS.value]:
+        candidates.extend((properties.get(key) or "").split())
+    formats: list[AudioFormat] = list(filter(lambda x: x, map(parse_audio_format, candidates)))
+    return max(formats, key=lambda x: x.sample_rate * x.bytes_per_frame) if formats else DEFAULT_AUDIO_FORMAT
+
+
+def describe_alsa_time(time_us: int, audio_format: AudioFormat) -> str:
+    frames: int = time_us * audio_format.sample_rate // 1000000
+    return f"[{time_us}] us = [{frames}] frames = [{frames * audio_format.bytes_per_frame}] bytes"
+
+
+def alsa_latency_planner(properties: dict[str, str], index: int, indexed_env: "IndexedEnvironment"):
+    buffer_key: str = MpdConfKey.OUTPUT_BUFFER_TIME.value
+    period_key: str = MpdConfKey.OUTPUT_PERIOD_TIME.value
+    target_latency: str = get_indexed_env_variable(
+        env_var=EnvironmentVariable.OUTPUT_TARGET_LATENCY,
+        index=index,
+        indexed_env=indexed_env)
+    period_count: str = get_indexed_env_variable(
+        env_var=EnvironmentVariable.OUTPUT_PERIOD_COUNT,
+        index=index,
+        indexed_env=indexed_env)
+    output_name: str = properties.get(MpdConfKey.OUTPUT_NAME.value)
+    if target_latency:
+        # user supplied values win over the calculated ones
+        buffer_time: int = int(target_latency) * 1000
+        if buffer_key in properties:
+            buffer_time = get_positive_int(properties, buffer_key) or buffer_time
+        else:
+            properties[buffer_key] = str(buffer_time)
+        if period_key not in properties:
+            count: int = int(period_count) if period_count else DEFAULT_ALSA_PERIOD_COUNT
+            properties[period_key] = str(buffer_time // max(count, MIN_ALSA_PERIOD_COUNT))
+        print(f"Output [{output_name}] target latency [{target_latency}] ms, "
+              f"period count [{period_count if period_count else DEFAULT_ALSA_PERIOD_COUNT}]")
+    audio_format: AudioFormat = get_planning_format(properties)
+    key: str
+    for key in [buffer_key, period_key]:
+        time_us: int = get_positive_int(properties, key)
+        if time_us:
+            print(f"Output [{output_name}] {key} {describe_alsa_time(time_us, audio_format)} "
+                  f"with format [{audio_format}]")
 
 
 class OutputTypeData:
@@ -686,10 +1005,12 @@ class OutputTypeData:
             self,
             output_type_name: str,
             enum_type: type[OutputProperty],
-            output_validator_type: type[OutputValidator] = None):
+            output_validator_type: type[OutputValidator] = None,
+            output_planner: Callable[[dict[str, str], int, "IndexedEnvironment"], None] = None):
         self.__output_type_name: str = output_type_name
         self.__enum_type: type[OutputProperty] = enum_type
         self.__output_validator_type: type[OutputValidator] = output_validator_type
+        self.__output_planner: Callable[[dict[str, str], int, "IndexedEnvironment"], None] = output_planner
 
     @property
     def output_type_name(self) -> str:
@@ -703,12 +1024,17 @@ class OutputTypeData:
     def output_validator_type(self) -> type[OutputValidator]:
         return self.__output_validator_type
 
+    @property
+    def output_planner(self) -> Callable[[dict[str, str], int, "IndexedEnvironment"], None]:
+        return self.__output_planner
+
 
 class OutputType(Enum):
     ALSA = OutputTypeData(
         output_type_name="alsa",
         enum_type=AlsaOutputProperty,
-        output_validator_type=AlsaOutputValidator)
+        output_validator_type=AlsaOutputValidator,
+        output_planner=alsa_latency_planner)
     PIPEWIRE = OutputTypeData(output_type_name="pipewire", enum_type=PipewireOutputProperty)
     PULSE = OutputTypeData(output_type_name="pulse", enum_type=PulseOutputProperty)
     NULL = OutputTypeData(output_type_name="null", enum_type=NullOutputProperty)
@@ -726,36 +1052,130 @@ class OutputType(Enum):
     def validator_type(self) -> type[OutputValidator]:
         return self.value.output_validator_type
 
+    @property
+    def output_planner(self) -> Callable[[dict[str, str], int, "IndexedEnvironment"], None]:
+        return self.value.output_planner
+
+
+# lookup tables, built once from the enums above
+OUTPUT_TYPE_BY_NAME: dict[str, OutputType] = dict(map(lambda x: (x.output_type_name, x), OutputType))
+OUTPUT_PROPERTIES_BY_NAME: dict[str, list[OutputProperty]] = dict(map(
+    lambda x: (x.output_type_name, list(x.enum_type)),
+    OutputType))
+OUTPUT_VALIDATORS_BY_NAME: dict[str, list[OutputValidator]] = dict(map(
+    lambda x: (x.output_type_name, list(x.validator_type) if x.validator_type else []),
+    OutputType))
+PLUGIN_PROPERTIES_BY_NAME: dict[str, list[PluginProperty]] = dict(map(
+    lambda x: (x.plugin_type_name, list(x.enum_type)),
+    PluginType))
+RUNNING_MODE_BY_NAME: dict[str, MpdRunningMode] = dict(map(lambda x: (x.value.mode_name, x), MpdRunningMode))
+INDEXED_VARIABLE_NAMES: frozenset[str] = frozenset(map(
+    lambda x: x.name,
+    filter(lambda x: x.indexed, EnvironmentVariable)))
+
+
+# variables that only make sense in the environment, not in the config file
+ENVIRONMENT_ONLY_VARIABLES: list[EnvironmentVariable] = [
+    EnvironmentVariable.LAUNCHER_CONFIG_FILE,
+    EnvironmentVariable.LAUNCHER_TIMING,
+    EnvironmentVariable.LAUNCHER_PROFILE_FILE]
+# variables used by the runner but never by resolve_layout and render_config, not part of the render hash
+LAUNCHER_ONLY_VARIABLES: list[EnvironmentVariable] = [
+    EnvironmentVariable.MPD_BINARY_PATH,
+    EnvironmentVariable.DB_TEMPLATE_FILE,
+    EnvironmentVariable.DB_TEMPLATE_MAX_AGE,
+    EnvironmentVariable.DB_TEMPLATE_HARDLINK,
+    EnvironmentVariable.LOG_MAX_SIZE,
+    EnvironmentVariable.LOG_ROTATE_COUNT,
+    EnvironmentVariable.LOG_CHECK_INTERVAL,
+    EnvironmentVariable.LOG_FLUSH_DIRECTORY,
+    EnvironmentVariable.LOG_FLUSH_INTERVAL,
+    EnvironmentVariable.MPD_RUNNING_MODE,
+    EnvironmentVariable.MPD_RUN_WITH_STDERR,
+    EnvironmentVariable.MPD_RUN_WITH_VERBOSE,
+    EnvironmentVariable.MPD_EXEC_IN_PLACE,
+    EnvironmentVariable.MPD_METRICS_ADDRESS,
+    EnvironmentVariable.MPD_CPU_AFFINITY,
+    EnvironmentVariable.MPD_SCHED_POLICY,
+    EnvironmentVariable.MPD_SCHED_PRIORITY,
+    EnvironmentVariable.MPD_MEMLOCK,
+    EnvironmentVariable.MPD_WAIT_READY,
+    EnvironmentVariable.MPD_READY_TIMEOUT,
+    EnvironmentVariable.MPD_POST_START_COMMAND,
+    EnvironmentVariable.MPD_RESTART_DELAY,
+    EnvironmentVariable.MPD_RESTART_MAX_DELAY,
+    EnvironmentVariable.MPD_RESTART_BACKOFF_FACTOR,
+    EnvironmentVariable.MPD_RESTART_JITTER,
+    EnvironmentVariable.MPD_RESTART_STABLE_UPTIME,
+    EnvironmentVariable.MPD_CRASH_LOOP_MAX_FAILURES,
+    EnvironmentVariable.MPD_CRASH_LOOP_WINDOW,
+    EnvironmentVariable.MPD_CRASH_LOOP_ACTION,
+    EnvironmentVariable.MPD_CRASH_LOOP_COOLDOWN,
+    EnvironmentVariable.LAUNCHER_TIMING,
+    EnvironmentVariable.LAUNCHER_PROFILE_FILE,
+    EnvironmentVariable.LAUNCHER_CONFIG_FILE,
+    EnvironmentVariable.ENABLE_CONFIG_CACHE]
+RENDER_INPUT_VARIABLE_NAMES: frozenset[str] = frozenset(map(
+    lambda x: x.name,
+    filter(lambda x: x not in LAUNCHER_ONLY_VARIABLES, EnvironmentVariable)))
+
+
+def get_config_key_aliases(env_var: EnvironmentVariable, prefix: str) -> list[str]:
+    # e.g. OUTPUT_MIXER_TYPE can be written as mixer_type, SOXR_QUALITY as quality or soxr_quality
+    aliases: list[str] = [env_var.name.lower()]
+    if env_var.name.startswith(prefix):
+        aliases.append(env_var.name[len(prefix):].lower())
+    if env_var.mpd_conf_key:
+        aliases.append(env_var.mpd_conf_key)
+    return aliases
+
+
+def build_config_keys(env_vars: list[EnvironmentVariable], prefix: str) -> dict[str, EnvironmentVariable]:
+    result: dict[str, EnvironmentVariable] = {}
+    env_var: EnvironmentVariable
+    for env_var in env_vars:
+        alias: str
+        for alias in get_config_key_aliases(env_var=env_var, prefix=prefix):
+            result.setdefault(alias, env_var)
+    return result
+
+
+OUTPUT_CONFIG_KEYS_BY_TYPE: dict[str, dict[str, EnvironmentVariable]] = dict(map(
+    lambda x: (x.output_type_name, build_config_keys(
+        env_vars=[
+            EnvironmentVariable.OUTPUT_CREATE,
+            EnvironmentVariable.OUTPUT_TYPE,
+            EnvironmentVariable.OUTPUT_NAME,
+            EnvironmentVariable.OUTPUT_ENABLED]
+        + list(map(lambda p: p.env_var, x.enum_type))
+        + ([EnvironmentVariable.OUTPUT_TARGET_LATENCY, EnvironmentVariable.OUTPUT_PERIOD_COUNT]
+           if x.output_planner else []),
+        prefix="OUTPUT_")),
+    OutputType))
+PLUGIN_CONFIG_KEYS_BY_NAME: dict[str, dict[str, EnvironmentVariable]] = dict(map(
+    lambda x: (x.plugin_type_name, dict(
+        [("create", x.create_env_var)]
+        + list(build_config_keys(
+            env_vars=list(map(lambda p: p.env_var, x.enum_type)),
+            prefix=f"{x.plugin_type_name.upper()}_").items()))),
+    PluginType))
+
 
 def get_output_properties_by_name(output_type_name: str) -> list[OutputProperty]:
-    ot: OutputType
-    for ot in OutputType:
-        if ot.output_type_name == output_type_name:
-            enum_type: type[OutputProperty] = ot.enum_type
-            return list(map(lambda x: x, enum_type))
-    return None
+    return OUTPUT_PROPERTIES_BY_NAME.get(output_type_name)
 
 
 def get_plugin_properties_by_name(plugin_type_name: str) -> list[PluginProperty]:
-    pt: PluginType
-    for pt in PluginType:
-        if pt.plugin_type_name == plugin_type_name:
-            enum_type: type[PluginProperty] = pt.enum_type
-            return list(map(lambda x: x, enum_type))
-    return None
+    return PLUGIN_PROPERTIES_BY_NAME.get(plugin_type_name)
 
 
 def get_output_validators_by_name(output_type_name: str) -> list[OutputValidator]:
-    for ot in OutputType:
-        if ot.output_type_name == output_type_name:
-            validator_type: type = ot.validator_type
-            return list(map(lambda x: x, validator_type)) if validator_type else []
-    return None
+    return OUTPUT_VALIDATORS_BY_NAME.get(output_type_name)
 
 
-def get_env_variable(env_var: EnvironmentVariable) -> str:
-    v: str = os.getenv(env_var.name, env_var.default_value)
-    if env_var.validator:
+def get_env_variable(env_var: EnvironmentVariable, environ: dict[str, str] = None) -> str:
+    v: str = (environ if environ is not None else os.environ).get(env_var.name, env_var.default_value)
+    if v and env_var.validator:
         v = env_var.validator(v)
     return v
 
@@ -764,20 +1184,62 @@ def get_env_variable_as_bool(env_var: EnvironmentVariable) -> bool:
     return get_env_variable(env_var=env_var).lower() == "yes"
 
 
-def get_indexed_env_variable(env_var: EnvironmentVariable, index: int = 0) -> bool:
-    key: str = f"{env_var.name}{'_' + str(index) if index > 0 else ''}"
-    v: str = os.getenv(key, env_var.default_value)
+class IndexedEnvironment:
+    """Indexed variables read from the environment in a single pass, grouped by index."""
+
+    def __init__(self, environ: dict[str, str] = None):
+        self.__values: dict[int, dict[str, str]] = {}
+        key: str
+        value: str
+        for key, value in (environ if environ is not None else os.environ).items():
+            name_and_index: tuple[str, int] = IndexedEnvironment.split_key(key, INDEXED_VARIABLE_NAMES)
+            if name_and_index:
+                name, index = name_and_index
+                self.__values.setdefault(index, {})[name] = value
+
+    @staticmethod
+    def split_key(key: str, indexed_names: frozenset[str]) -> tuple[str, int]:
+        if key in indexed_names:
+            return key, 0
+        name, sep, suffix = key.rpartition("_")
+        # only the keys generated as NAME_<index>, index > 0, are valid
+        if sep and name in indexed_names and suffix.isdigit() and str(int(suffix)) == suffix and int(suffix) > 0:
+            return name, int(suffix)
+        return None
+
+    @property
+    def indexes(self) -> list[int]:
+        return sorted(self.__values.keys())
+
+    def get(self, env_var: EnvironmentVariable, index: int = 0) -> str:
+        return self.__values.get(index, {}).get(env_var.name, env_var.default_value)
+
+
+def get_indexed_env_variable(
+        env_var: EnvironmentVariable,
+        index: int = 0,
+        indexed_env: IndexedEnvironment = None) -> str:
+    v: str
+    if indexed_env:
+        v = indexed_env.get(env_var=env_var, index=index)
+    else:
+        key: str = f"{env_var.name}{'_' + str(index) if index > 0 else ''}"
+        v = os.getenv(key, env_var.default_value)
     if v and env_var.validator:
         v = env_var.validator(v)
     return v
 
 
-def get_indexed_env_variable_as_bool(env_var: EnvironmentVariable, index: int = 0) -> bool:
-    v: str = yes_no_or_empty(get_indexed_env_variable(env_var=env_var, index=index))
+def get_indexed_env_variable_as_bool(
+        env_var: EnvironmentVariable,
+        index: int = 0,
+        indexed_env: IndexedEnvironment = None) -> bool:
+    v: str = yes_no_or_empty(get_indexed_env_variable(env_var=env_var, index=index, indexed_env=indexed_env))
     return v and v.lower() == "yes"
 
 
-def get_cache_directory() -> str:
+def resolve_cache_directory_path(uid: int = None) -> pathlib.Path:
+    # path resolution only, nothing is created here, uid is the user mpd runs as (defaults to the current one)
     cache_dir: str = os.getenv(EnvironmentVariable.CACHE_DIRECTORY.name)
     cache_dir_path: pathlib.Path
     if not cache_dir:
@@ -785,7 +1247,7 @@ def get_cache_directory() -> str:
         if not instance_name:
             raise RequiredVariable("Instance name is required if cache directory is not specified")
         # fallback
-        if os.getuid() != 0:
+        if (uid if uid is not None else os.getuid()) != 0:
             home_path: pathlib.Path = pathlib.Path.home()
             if not home_path:
                 raise NoHomePath("Cannot get home path")
@@ -796,119 +1258,212 @@ def get_cache_directory() -> str:
     else:
         # use the specified cache directory
         cache_dir_path: pathlib.Path = pathlib.Path(os.path.expanduser(cache_dir))
-    if not cache_dir_path.exists():
-        # does not exist.
-        print(f"Creating directory [{cache_dir_path}] ...")
-        cache_dir_path.mkdir(parents=True)
-        print(f"Created directory [{cache_dir_path}].")
-    else:
-        if not cache_dir_path.is_dir():
-            print(f"Path [{cache_dir_path}] already exists, but it's not a directory")
-            raise MustBeDirectory()
-    return str(cache_dir_path.absolute())
+    return cache_dir_path
 
 
-def get_directory(env_var: EnvironmentVariable, fallback_cache_dir_name: str) -> str:
+def resolve_directory_path(
+        env_var: EnvironmentVariable,
+        fallback_cache_dir_name: str,
+        cache_dir_path: pathlib.Path = None,
+        uid: int = None) -> pathlib.Path:
+    # path resolution only, nothing is created here
     the_dir: str = get_env_variable(env_var)
     if not the_dir:
-        # not specified
-        if os.getuid() != 0:
-            # create a music dir inside cache dir
-            cache_dir: str = get_cache_directory()
-            music_dir_path = pathlib.Path.joinpath(pathlib.Path(cache_dir), fallback_cache_dir_name)
-            # create if it does not exist
-            if not music_dir_path.exists() or not music_dir_path.is_dir():
-                # does not exist.
-                print(f"Creating {fallback_cache_dir_name} directory [{music_dir_path}] ...")
-                music_dir_path.mkdir(parents=True)
-                print(f"Created {fallback_cache_dir_name} directory [{music_dir_path}].")
-        else:
+        # not specified, use a directory inside the cache directory
+        if (uid if uid is not None else os.getuid()) == 0:
             # what if we run as root?
             raise RootUserNotSupported("Cannot run as root")
-        return str(music_dir_path.absolute())
-    else:
-        # does the specified directory exist?
-        specified_music_path: pathlib.Path = pathlib.Path(os.path.expanduser(the_dir))
-        if not specified_music_path.exists():
-            # create
-            print(f"Creating directory [{specified_music_path}] ...")
-            specified_music_path.mkdir(parents=True)
-            print(f"Created directory [{specified_music_path}].")
-        else:
-            if not specified_music_path.is_dir():
-                print(f"Path [{specified_music_path}] already exists, but it's not a directory")
-                raise MustBeDirectory()
-        return str(specified_music_path.absolute())
+        cache_dir_path = cache_dir_path if cache_dir_path else resolve_cache_directory_path(uid=uid)
+        return pathlib.Path.joinpath(cache_dir_path, fallback_cache_dir_name).absolute()
+    return pathlib.Path(os.path.expanduser(the_dir)).absolute()
 
 
-def get_music_directory() -> str:
-    return get_directory(env_var=EnvironmentVariable.MUSIC_DIRECTORY, fallback_cache_dir_name="music")
+class ResolvedLayout:
+    """Directories and files used by mpd, resolved once at startup."""
 
+    def __init__(
+            self,
+            cache_directory: pathlib.Path,
+            music_directory: pathlib.Path,
+            playlist_directory: pathlib.Path,
+            config_directory: pathlib.Path,
+            log_directory: pathlib.Path,
+            config_file: pathlib.Path,
+            log_file: pathlib.Path,
+            db_file: pathlib.Path,
+            sticker_file: pathlib.Path,
+            state_file: pathlib.Path,
+            state_file_interval: str):
+        self.__cache_directory: pathlib.Path = cache_directory
+        self.__music_directory: pathlib.Path = music_directory
+        self.__playlist_directory: pathlib.Path = playlist_directory
+        self.__config_directory: pathlib.Path = config_directory
+        self.__log_directory: pathlib.Path = log_directory
+        self.__config_file: pathlib.Path = config_file
+        self.__log_file: pathlib.Path = log_file
+        self.__db_file: pathlib.Path = db_file
+        self.__sticker_file: pathlib.Path = sticker_file
+        self.__state_file: pathlib.Path = state_file
+        self.__state_file_interval: str = state_file_interval
 
-def get_playlist_directory() -> str:
-    return get_directory(env_var=EnvironmentVariable.PLAYLIST_DIRECTORY, fallback_cache_dir_name="playlist")
-
+    @property
+    def cache_directory(self) -> pathlib.Path:
+        return self.__cache_directory
 
-def get_config_directory() -> str:
-    return get_directory(env_var=EnvironmentVariable.CONFIG_DIRECTORY, fallback_cache_dir_name="config")
+    @property
+    def music_directory(self) -> pathlib.Path:
+        return self.__music_directory
 
+    @property
+    def playlist_directory(self) -> pathlib.Path:
+        return self.__playlist_directory
 
-def get_log_directory() -> str:
-    return get_directory(env_var=EnvironmentVariable.LOG_DIRECTORY, fallback_cache_dir_name="log")
+    @property
+    def config_directory(self) -> pathlib.Path:
+        return self.__config_directory
 
+    @property
+    def log_directory(self) -> pathlib.Path:
+        return self.__log_directory
 
-def get_log_file() -> str:
-    if not get_env_variable_as_bool(env_var=EnvironmentVariable.ENABLE_LOG_FILE):
-        return None
-    log_file_name: str = get_env_variable(env_var=EnvironmentVariable.LOG_FILE_NAME)
-    if log_file_name:
-        return str(pathlib.Path(get_log_directory()).joinpath(log_file_name))
-    return None
+    @property
+    def config_file(self) -> pathlib.Path:
+        return self.__config_file
 
+    @property
+    def log_file(self) -> pathlib.Path:
+        return self.__log_file
 
-def get_db_file() -> str:
-    if not get_env_variable_as_bool(env_var=EnvironmentVariable.ENABLE_DB_FILE):
-        return None
-    db_file: str = get_env_variable(env_var=EnvironmentVariable.DB_FILE)
-    if db_file:
-        return str(pathlib.Path(get_config_directory()).joinpath(db_file))
-    return None
+    @property
+    def db_file(self) -> pathlib.Path:
+        return self.__db_file
 
+    @property
+    def sticker_file(self) -> pathlib.Path:
+        return self.__sticker_file
 
-def get_sticker_file() -> str:
-    if not get_env_variable_as_bool(env_var=EnvironmentVariable.ENABLE_STICKER_FILE):
-        return None
-    sticker_file: str = get_env_variable(env_var=EnvironmentVariable.STICKER_FILE)
-    if sticker_file:
-        return str(pathlib.Path(get_config_directory()).joinpath(sticker_file))
-    return None
+    @property
+    def state_file(self) -> pathlib.Path:
+        return self.__state_file
 
+    @property
+    def state_file_interval(self) -> str:
+        return self.__state_file_interval
 
-def get_state_file() -> str:
-    if not get_env_variable_as_bool(env_var=EnvironmentVariable.ENABLE_STATE_FILE):
-        return None
-    sticker_file: str = get_env_variable(env_var=EnvironmentVariable.STATE_FILE)
-    if sticker_file:
-        return str(pathlib.Path(get_config_directory()).joinpath(sticker_file))
-    return None
+    @property
+    def directories(self) -> list[pathlib.Path]:
+        # parents first, duplicates removed, order is deterministic
+        result: list[pathlib.Path] = []
+        d: pathlib.Path
+        for d in [
+                self.__cache_directory,
+                self.__music_directory,
+                self.__playlist_directory,
+                self.__config_directory,
+                self.__log_directory]:
+            if d and d not in result:
+                result.append(d)
+        return result
+
+    def create_directories(self):
+        # one stat per directory, then create the missing ones
+        missing: list[pathlib.Path] = []
+        d: pathlib.Path
+        for d in self.directories:
+            try:
+                st: os.stat_result = os.stat(d)
+            except FileNotFoundError:
+                missing.append(d)
+                continue
+            if not stat.S_ISDIR(st.st_mode):
+                print(f"Path [{d}] already exists, but it's not a directory")
+                raise MustBeDirectory()
+        for d in missing:
+            print(f"Creating directory [{d}] ...")
+            d.mkdir(parents=True, exist_ok=True)
+            print(f"Created directory [{d}].")
 
 
-def get_state_file_interval() -> str:
+def get_file_in_directory(
+        directory: pathlib.Path,
+        enable_env_var: EnvironmentVariable,
+        file_name_env_var: EnvironmentVariable) -> pathlib.Path:
+    if not get_env_variable_as_bool(env_var=enable_env_var):
+        return None
+    file_name: str = get_env_variable(env_var=file_name_env_var)
+    return directory.joinpath(file_name) if file_name else None
+
+
+def resolve_layout(uid: int = None) -> ResolvedLayout:
+    log_file_name: str = (get_env_variable(env_var=EnvironmentVariable.LOG_FILE_NAME)
+                          if (get_env_variable_as_bool(env_var=EnvironmentVariable.ENABLE_LOG_FILE)
+                              and get_log_target() == LogTarget.FILE)
+                          else None)
+    directory_env_vars: list[EnvironmentVariable] = [
+        EnvironmentVariable.MUSIC_DIRECTORY,
+        EnvironmentVariable.PLAYLIST_DIRECTORY,
+        EnvironmentVariable.CONFIG_DIRECTORY]
+    if log_file_name:
+        directory_env_vars.append(EnvironmentVariable.LOG_DIRECTORY)
+    # the cache directory is needed only when some directory is not specified
+    needs_cache: bool = any(map(lambda x: not get_env_variable(env_var=x), directory_env_vars))
+    cache_directory: pathlib.Path = resolve_cache_directory_path(uid=uid).absolute() if needs_cache else None
+    config_directory: pathlib.Path = resolve_directory_path(
+        env_var=EnvironmentVariable.CONFIG_DIRECTORY,
+        fallback_cache_dir_name="config",
+        cache_dir_path=cache_directory,
+        uid=uid)
+    log_directory: pathlib.Path = (resolve_directory_path(
+        env_var=EnvironmentVariable.LOG_DIRECTORY,
+        fallback_cache_dir_name="log",
+        cache_dir_path=cache_directory,
+        uid=uid)
+        if log_file_name else None)
+    state_file: pathlib.Path = get_file_in_directory(
+        directory=config_directory,
+        enable_env_var=EnvironmentVariable.ENABLE_STATE_FILE,
+        file_name_env_var=EnvironmentVariable.STATE_FILE)
     # relevant only if state file is specified
-    if get_state_file():
-        state_file_interval: str = get_env_variable(env_var=EnvironmentVariable.STATE_FILE_INTERVAL)
-        return must_be_int(state_file_interval) if state_file_interval else None
-    return None
+    state_file_interval: str = (get_env_variable(env_var=EnvironmentVariable.STATE_FILE_INTERVAL)
+                                if state_file else None)
+    return ResolvedLayout(
+        cache_directory=cache_directory,
+        music_directory=resolve_directory_path(
+            env_var=EnvironmentVariable.MUSIC_DIRECTORY,
+            fallback_cache_dir_name="music",
+            cache_dir_path=cache_directory,
+            uid=uid),
+        playlist_directory=resolve_directory_path(
+            env_var=EnvironmentVariable.PLAYLIST_DIRECTORY,
+            fallback_cache_dir_name="playlist",
+            cache_dir_path=cache_directory,
+            uid=uid),
+        config_directory=config_directory,
+        log_directory=log_directory,
+        config_file=config_directory.joinpath(get_env_variable(env_var=EnvironmentVariable.CONFIG_FILE_NAME)),
+        log_file=log_directory.joinpath(log_file_name) if log_directory else None,
+        # mpd does not accept both a db file and a database plugin
+        db_file=(get_file_in_directory(
+            directory=config_directory,
+            enable_env_var=EnvironmentVariable.ENABLE_DB_FILE,
+            file_name_env_var=EnvironmentVariable.DB_FILE)
+            if not get_env_variable_as_bool(env_var=EnvironmentVariable.DATABASE_PROXY_CREATE)
+            else None),
+        sticker_file=get_file_in_directory(
+            directory=config_directory,
+            enable_env_var=EnvironmentVariable.ENABLE_STICKER_FILE,
+            file_name_env_var=EnvironmentVariable.STICKER_FILE),
+        state_file=state_file,
+        state_file_interval=must_be_int(state_file_interval) if state_file_interval else None)
 
 
 def write_simple_value(f, key: str, value: str):
     f.write(f"{key} \"{value}\"\n")
 
 
-def write_by_getter(f, getter: Callable[[], str], key_name: str):
-    v: str = getter()
-    if v:
-        write_simple_value(f, key_name, v)
+def write_optional_value(f, key: str, value: any):
+    if value:
+        write_simple_value(f, key, str(value))
 
 
 def write_variable(f, env_var: EnvironmentVariable):
@@ -947,6 +1502,71 @@ def write_structured_plugin(f, plugin_type: PluginType):
             properties=properties)
 
 
+def write_input_cache(f):
+    size: str = get_env_variable(env_var=EnvironmentVariable.INPUT_CACHE_SIZE)
+    if not size:
+        return
+    size_bytes: int = parse_size(size)
+    # the cache is filled up to its size, warn when it competes with the rest of the system
+    meminfo: dict[str, int] = common.read_meminfo()
+    total_kb: int = meminfo.get("MemTotal")
+    available_kb: int = meminfo.get("MemAvailable")
+    max_percent: int = int(get_env_variable(env_var=EnvironmentVariable.INPUT_CACHE_MAX_MEMORY_PERCENT))
+    if total_kb and size_bytes > total_kb * 1024:
+        print(f"Input cache size [{size}] is larger than the total memory [{total_kb}] kB")
+    elif available_kb and size_bytes > available_kb * 1024 * max_percent // 100:
+        print(f"Input cache size [{size}] is more than [{max_percent}]% "
+              f"of the available memory [{available_kb}] kB")
+    f.write("input_cache {\n")
+    f.write(f"  {EnvironmentVariable.INPUT_CACHE_SIZE.mpd_conf_key} \"{size}\"\n")
+    f.write("}\n")
+
+
+# defaults of mpd, used when a limit is not set
+MPD_DEFAULT_MAX_CONNECTIONS: int = 100
+MPD_DEFAULT_MAX_OUTPUT_BUFFER_SIZE_KB: int = 8192
+MPD_DEFAULT_MAX_COMMAND_LIST_SIZE_KB: int = 2048
+MPD_DEFAULT_MAX_PLAYLIST_LENGTH: int = 16384
+MPD_DEFAULT_AUDIO_BUFFER_SIZE_KB: int = 4096
+# rough size of a song in the queue, including its tags
+QUEUE_SONG_BYTES: int = 1024
+
+
+def get_limit(env_var: EnvironmentVariable, default_value: int) -> int:
+    v: str = get_env_variable(env_var=env_var)
+    return int(v) if v else default_value
+
+
+def check_resource_limits():
+    """Warn when the worst case memory allowed by the limits exceeds a share of the host memory."""
+    limit_env_vars: list[EnvironmentVariable] = [
+        EnvironmentVariable.MAX_CONNECTIONS,
+        EnvironmentVariable.MAX_OUTPUT_BUFFER_SIZE,
+        EnvironmentVariable.MAX_PLAYLIST_LENGTH,
+        EnvironmentVariable.MAX_COMMAND_LIST_SIZE]
+    # the defaults of mpd are sized by its developers, check only what has been changed
+    if not any(map(lambda x: get_env_variable(env_var=x), limit_env_vars)):
+        return
+    total_kb: int = common.read_meminfo().get("MemTotal")
+    if not total_kb:
+        return
+    # every client can fill its output buffer and its command list
+    clients_kb: int = get_limit(EnvironmentVariable.MAX_CONNECTIONS, MPD_DEFAULT_MAX_CONNECTIONS) * (
+        get_limit(EnvironmentVariable.MAX_OUTPUT_BUFFER_SIZE, MPD_DEFAULT_MAX_OUTPUT_BUFFER_SIZE_KB)
+        + get_limit(EnvironmentVariable.MAX_COMMAND_LIST_SIZE, MPD_DEFAULT_MAX_COMMAND_LIST_SIZE_KB))
+    queue_kb: int = (get_limit(EnvironmentVariable.MAX_PLAYLIST_LENGTH, MPD_DEFAULT_MAX_PLAYLIST_LENGTH)
+                     * QUEUE_SONG_BYTES // 1024)
+    audio_buffer_kb: int = get_limit(EnvironmentVariable.AUDIO_BUFFER_SIZE, MPD_DEFAULT_AUDIO_BUFFER_SIZE_KB)
+    input_cache_size: str = get_env_variable(env_var=EnvironmentVariable.INPUT_CACHE_SIZE)
+    input_cache_kb: int = parse_size(input_cache_size) // 1024 if input_cache_size else 0
+    combined_kb: int = clients_kb + queue_kb + audio_buffer_kb + input_cache_kb
+    max_percent: int = int(get_env_variable(env_var=EnvironmentVariable.LIMITS_MAX_MEMORY_PERCENT))
+    if combined_kb > total_kb * max_percent // 100:
+        print(f"Limits allow up to [{combined_kb}] kB, more than [{max_percent}]% of the total memory "
+              f"[{total_kb}] kB: clients [{clients_kb}] kB, queue [{queue_kb}] kB, "
+              f"audio buffer [{audio_buffer_kb}] kB, input cache [{input_cache_kb}] kB")
+
+
 def write_output(
         f,
         output_type: str,
@@ -958,26 +1578,120 @@ def write_output(
     f.write("}\n")
 
 
-def write_config_file() -> str:
-    config_dir: str = get_config_directory()
-    config_file_name: str = get_env_variable(env_var=EnvironmentVariable.CONFIG_FILE_NAME)
-    config_file: pathlib.Path = pathlib.Path(config_dir).joinpath(config_file_name)
+def is_render_input_key(key: str) -> bool:
+    name_and_index: tuple[str, int] = IndexedEnvironment.split_key(key, INDEXED_VARIABLE_NAMES)
+    return (name_and_index[0] if name_and_index else key) in RENDER_INPUT_VARIABLE_NAMES
+
+
+def get_render_input_hash() -> str:
+    render_input: list[tuple[str, str]] = sorted(filter(
+        lambda kv: is_render_input_key(kv[0]),
+        os.environ.items()))
+    # things that affect the resolution of the fallback directories
+    render_input.append(("HOME", os.getenv("HOME", "")))
+    render_input.append(("UID", str(os.getuid())))
+    render_input.append(("CONFIG_SCHEMA_VERSION", CONFIG_SCHEMA_VERSION))
+    render_input.append(("RUNNER_SOURCE", common.get_runner_source_hash("mpd-runner.py")))
+    h = hashlib.sha256()
+    k: str
+    v: str
+    for k, v in render_input:
+        h.update(f"{k}={v}\0".encode("utf-8"))
+    return h.hexdigest()
+
+
+def read_render_hash(hash_file: pathlib.Path) -> str:
+    try:
+        with open(str(hash_file), "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def write_config_file(layout: ResolvedLayout, timer: common.PhaseTimer = None) -> str:
+    timer = timer if timer else common.PhaseTimer(runner_name="mpd-runner")
+    config_file: pathlib.Path = layout.config_file
     print(f"MPD config file name: [{config_file}]")
-    with open(str(config_file), "w") as f:
-        write_by_getter(f=f, getter=get_music_directory, key_name=MpdConfKey.MUSIC_DIRECTORY.value)
-        write_by_getter(f=f, getter=get_playlist_directory, key_name=MpdConfKey.PLAYLIST_DIRECTORY.value)
-        write_by_getter(f=f, getter=get_db_file, key_name=MpdConfKey.DB_FILE.value)
-        write_by_getter(f=f, getter=get_log_file, key_name=MpdConfKey.LOG_FILE.value)
-        write_variable(f=f, env_var=EnvironmentVariable.PID_FILE)
-        write_by_getter(f=f, getter=get_state_file, key_name=EnvironmentVariable.STATE_FILE.mpd_conf_key)
-        write_by_getter(
+    use_cache: bool = get_env_variable_as_bool(env_var=EnvironmentVariable.ENABLE_CONFIG_CACHE)
+    render_hash: str = get_render_input_hash() if use_cache else None
+    hash_file: pathlib.Path = config_file.with_name(f"{config_file.name}.sha256")
+    # on every run, directories can disappear while the configuration is unchanged (e.g. on a tmpfs)
+    layout.create_directories()
+    timer.mark("create_directories")
+    if use_cache and config_file.is_file() and read_render_hash(hash_file) == render_hash:
+        print(f"MPD config file [{config_file}] is up to date, not rendering.")
+        timer.mark("config_cache_hit")
+        return str(config_file)
+    timer.mark("config_cache_check")
+    content: str = render_config(layout=layout)
+    timer.mark("render_config")
+    common.write_file_atomically(file_path=config_file, content=content)
+    if use_cache:
+        common.write_file_atomically(file_path=hash_file, content=f"{render_hash}\n")
+    timer.mark("write_config")
+    return str(config_file)
+
+
+def seed_db_file(layout: ResolvedLayout):
+    """Create a missing DB file from a template, so that mpd does not scan the whole library."""
+    template: str = get_env_variable(env_var=EnvironmentVariable.DB_TEMPLATE_FILE)
+    if not template:
+        return
+    if not layout.db_file:
+        print("No DB file is used, ignoring the DB template file")
+        return
+    if os.path.lexists(layout.db_file):
+        print(f"DB file [{layout.db_file}] already exists, not seeding")
+        return
+    template_path: pathlib.Path = pathlib.Path(os.path.expanduser(template)).absolute()
+    try:
+        st: os.stat_result = os.stat(template_path)
+    except OSError as e:
+        print(f"Cannot use DB template file [{template_path}]: [{e}]")
+        return
+    if not stat.S_ISREG(st.st_mode) or st.st_size == 0:
+        print(f"DB template file [{template_path}] is not a regular file or is empty, not seeding")
+        return
+    # a template older than this would make mpd start with a library too far from the truth
+    max_age_hours: int = int(get_env_variable(env_var=EnvironmentVariable.DB_TEMPLATE_MAX_AGE))
+    age_hours: float = (time.time() - st.st_mtime) / 3600.0
+    if max_age_hours > 0 and age_hours > max_age_hours:
+        print(f"DB template file [{template_path}] is [{age_hours:.1f}] hours old, "
+              f"more than [{max_age_hours}], not seeding")
+        return
+    try:
+        # mpd saves the DB to a new file and then replaces the old one, so a hard link
+        # never lets mpd modify the template
+        method: str = common.clone_file(
+            source=template_path,
+            target=layout.db_file,
+            allow_hardlink=get_env_variable_as_bool(env_var=EnvironmentVariable.DB_TEMPLATE_HARDLINK))
+    except OSError as e:
+        print(f"Cannot seed DB file [{layout.db_file}] from [{template_path}]: [{e}]")
+        return
+    print(f"Seeded DB file [{layout.db_file}] from [{template_path}] "
+          f"([{age_hours:.1f}] hours old) using [{method}]")
+
+
+def render_config(layout: ResolvedLayout) -> str:
+    with io.StringIO() as f:
+        write_optional_value(f=f, key=MpdConfKey.MUSIC_DIRECTORY.value, value=layout.music_directory)
+        write_optional_value(f=f, key=MpdConfKey.PLAYLIST_DIRECTORY.value, value=layout.playlist_directory)
+        write_optional_value(f=f, key=MpdConfKey.DB_FILE.value, value=layout.db_file)
+        write_optional_value(
             f=f,
-            getter=get_state_file_interval,
-            key_name=EnvironmentVariable.STATE_FILE_INTERVAL.mpd_conf_key)
-        write_by_getter(
+            key=MpdConfKey.LOG_FILE.value,
+            value=(LogTarget.SYSLOG.value
+                   if (get_env_variable_as_bool(env_var=EnvironmentVariable.ENABLE_LOG_FILE)
+                       and get_log_target() == LogTarget.SYSLOG)
+                   else layout.log_file))
+        write_variable(f=f, env_var=EnvironmentVariable.PID_FILE)
+        write_optional_value(f=f, key=EnvironmentVariable.STATE_FILE.mpd_conf_key, value=layout.state_file)
+        write_optional_value(
             f=f,
-            getter=get_sticker_file,
-            key_name=EnvironmentVariable.STICKER_FILE.mpd_conf_key)
+            key=EnvironmentVariable.STATE_FILE_INTERVAL.mpd_conf_key,
+            value=layout.state_file_interval)
+        write_optional_value(f=f, key=EnvironmentVariable.STICKER_FILE.mpd_conf_key, value=layout.sticker_file)
         bind_addresses: str = get_env_variable(env_var=EnvironmentVariable.MPD_BIND_ADDRESS)
         if bind_addresses:
             # split by ","
@@ -991,31 +1705,46 @@ def write_config_file() -> str:
         write_variable(f=f, env_var=EnvironmentVariable.MPD_PORT)
         write_variable(f=f, env_var=EnvironmentVariable.LOG_LEVEL)
         write_variable(f=f, env_var=EnvironmentVariable.RESTORE_PAUSED)
-        # outputs
-        max_outputs: int = 100
-        for i in range(0, max_outputs):
-            output_create: bool = get_indexed_env_variable_as_bool(env_var=EnvironmentVariable.OUTPUT_CREATE, index=i)
+        # outputs, only the indexes actually found in the environment are visited
+        indexed_env: IndexedEnvironment = IndexedEnvironment()
+        i: int
+        for i in indexed_env.indexes:
+            output_create: bool = get_indexed_env_variable_as_bool(
+                env_var=EnvironmentVariable.OUTPUT_CREATE,
+                index=i,
+                indexed_env=indexed_env)
             # print(f"Output [{i}] must be created: [{'yes' if output_create is True else 'no'}]")
             if output_create:
                 output_type: str = Validator.MUST_BE_OUTPUT_TYPE.value(get_indexed_env_variable(
                     env_var=EnvironmentVariable.OUTPUT_TYPE,
-                    index=i))
+                    index=i,
+                    indexed_env=indexed_env))
                 properties: dict[str, str] = {}
                 # name is mandatory, so if it's not provided, we
                 # generate a name based on the index i
-                output_name: str = get_indexed_env_variable(env_var=EnvironmentVariable.OUTPUT_NAME, index=i)
+                output_name: str = get_indexed_env_variable(
+                    env_var=EnvironmentVariable.OUTPUT_NAME,
+                    index=i,
+                    indexed_env=indexed_env)
                 if not output_name:
                     output_name = f"output_{i}"
                 properties[EnvironmentVariable.OUTPUT_NAME.mpd_conf_key] = output_name
-                enabled: str = get_indexed_env_variable(env_var=EnvironmentVariable.OUTPUT_ENABLED, index=i)
+                enabled: str = get_indexed_env_variable(
+                    env_var=EnvironmentVariable.OUTPUT_ENABLED,
+                    index=i,
+                    indexed_env=indexed_env)
                 if enabled:
                     properties[EnvironmentVariable.OUTPUT_ENABLED.mpd_conf_key] = ("yes" if enabled.lower() == "yes"
                                                                                    else "no")
                 property_list: list = get_output_properties_by_name(output_type)
                 for p in property_list:
-                    v: str = get_indexed_env_variable(env_var=p.env_var, index=i)
+                    v: str = get_indexed_env_variable(env_var=p.env_var, index=i, indexed_env=indexed_env)
                     if v:
                         properties[p.env_var.mpd_conf_key] = v
+                # calculated properties, if the output type supports them
+                output_planner: Callable = OUTPUT_TYPE_BY_NAME[output_type].output_planner
+                if output_planner:
+                    output_planner(properties, i, indexed_env)
                 # validate properties?
                 validator_list: list[OutputValidator] = get_output_validators_by_name(output_type)
                 validator: OutputValidator
@@ -1032,12 +1761,18 @@ def write_config_file() -> str:
         plugin_type: PluginType
         for plugin_type in PluginType:
             write_structured_plugin(f=f, plugin_type=plugin_type)
+        write_input_cache(f=f)
         # final stuff
         write_variable(f=f, env_var=EnvironmentVariable.SAMPLERATE_CONVERTER)
         write_variable(f=f, env_var=EnvironmentVariable.FILESYSTEM_CHARSET)
         write_variable(f=f, env_var=EnvironmentVariable.AUDIO_BUFFER_SIZE)
-        f.close()
-    return str(config_file)
+        write_variable(f=f, env_var=EnvironmentVariable.MAX_CONNECTIONS)
+        write_variable(f=f, env_var=EnvironmentVariable.MAX_OUTPUT_BUFFER_SIZE)
+        write_variable(f=f, env_var=EnvironmentVariable.MAX_PLAYLIST_LENGTH)
+        write_variable(f=f, env_var=EnvironmentVariable.CONNECTION_TIMEOUT)
+        write_variable(f=f, env_var=EnvironmentVariable.MAX_COMMAND_LIST_SIZE)
+        check_resource_limits()
+        return f.getvalue()
 
 
 def yes_no_or_empty(v: str) -> str:
@@ -1054,33 +1789,464 @@ def must_be_int(v: str) -> str:
         raise exceptions.NotAnIntegerValue(f"Value [{v}] is not an integer")
 
 
+def parse_size(v: str) -> int:
+    """Size in bytes, in the format accepted by mpd (e.g. 65536, 512 kB, 256M, 1 GB)."""
+    match: re.Match = re.fullmatch(r"\s*(\d+)\s*([kMG]?)B?\s*", v)
+    if not match:
+        raise NotASize(f"Value [{v}] is not a size, examples: [65536], [512 kB], [256 MB], [1 GB]")
+    return int(match.group(1)) * {"": 1, "k": 1024, "M": 1024 ** 2, "G": 1024 ** 3}[match.group(2)]
+
+
+def must_be_size(v: str) -> str:
+    parse_size(v)
+    return v.strip()
+
+
+def must_be_log_target(v: str) -> str:
+    if v in list(map(lambda x: x.value, LogTarget)):
+        return v
+    raise NotALogTarget(f"Value [{v}] must be one of {list(map(lambda x: x.value, LogTarget))}")
+
+
+def must_be_crash_loop_action(v: str) -> str:
+    if v in list(map(lambda x: x.value, common.CrashLoopAction)):
+        return v
+    raise exceptions.NotACrashLoopAction(
+        f"Value [{v}] must be one of {list(map(lambda x: x.value, common.CrashLoopAction))}")
+
+
 def must_be_output_type(v: str) -> str:
-    for ot in OutputType:
-        if ot.value.output_type_name == v:
-            return v
+    if v in OUTPUT_TYPE_BY_NAME:
+        return v
     raise NotAnOutputType(f"Value [{v}] is not an output type")
 
 
 def must_be_running_mode(v: str) -> str:
-    for ot in MpdRunningMode:
-        if ot.value.mode_name == v:
-            return v
+    if v in RUNNING_MODE_BY_NAME:
+        return v
     raise NotARunningMode(f"Value [{v}] is not a running mode")
 
 
+def add_config_variable(
+        variables: dict[str, str],
+        errors: list[str],
+        env_var: EnvironmentVariable,
+        name: str,
+        value: any,
+        where: str):
+    v: str = common.config_value_to_str(value)
+    if v is None:
+        errors.append(f"{where}: value of [{name}] must be a string, a number or a boolean")
+        return
+    try:
+        if v and env_var.validator:
+            env_var.validator(v)
+    except Exception as e:
+        errors.append(f"{where}: [{name}] {e}")
+        return
+    variables[name] = v
+
+
+def validate_output_config(
+        variables: dict[str, str],
+        errors: list[str],
+        output: dict[str, any],
+        index: int):
+    where: str = f"outputs[{index}]"
+    if not isinstance(output, dict):
+        errors.append(f"{where}: must be a table")
+        return
+    output_type: str = common.config_value_to_str(output.get("type", EnvironmentVariable.OUTPUT_TYPE.default_value))
+    if output_type not in OUTPUT_CONFIG_KEYS_BY_TYPE:
+        errors.append(f"{where}: [{output_type}] is not an output type")
+        return
+    config_keys: dict[str, EnvironmentVariable] = OUTPUT_CONFIG_KEYS_BY_TYPE[output_type]
+    suffix: str = f"_{index}" if index > 0 else ""
+    # outputs listed in the config file are created, unless specified otherwise
+    variables[f"{EnvironmentVariable.OUTPUT_CREATE.name}{suffix}"] = "yes"
+    key: str
+    value: any
+    for key, value in output.items():
+        env_var: EnvironmentVariable = config_keys.get(key.lower())
+        if not env_var:
+            errors.append(f"{where}: unknown key [{key}] for output type [{output_type}]")
+            continue
+        add_config_variable(variables, errors, env_var, f"{env_var.name}{suffix}", value, where)
+
+
+def validate_plugin_config(
+        variables: dict[str, str],
+        errors: list[str],
+        plugin_name: str,
+        plugin: dict[str, any]):
+    where: str = f"plugins.{plugin_name}"
+    config_keys: dict[str, EnvironmentVariable] = PLUGIN_CONFIG_KEYS_BY_NAME.get(plugin_name.lower())
+    if not config_keys:
+        errors.append(f"{where}: [{plugin_name}] is not a plugin")
+        return
+    if not isinstance(plugin, dict):
+        errors.append(f"{where}: must be a table")
+        return
+    # plugins listed in the config file are created, unless specified otherwise
+    variables[config_keys["create"].name] = "yes"
+    key: str
+    value: any
+    for key, value in plugin.items():
+        env_var: EnvironmentVariable = config_keys.get(key.lower())
+        if not env_var:
+            errors.append(f"{where}: unknown key [{key}]")
+            continue
+        add_config_variable(variables, errors, env_var, env_var.name, value, where)
+
+
+def validate_config_data(data: dict[str, any], errors: list[str]) -> dict[str, str]:
+    """Convert the content of a config file to variables, collecting all the errors."""
+    variables: dict[str, str] = {}
+    key: str
+    value: any
+    for key, value in data.items():
+        if key == "outputs":
+            if not isinstance(value, list):
+                errors.append("outputs: must be an array of tables")
+                continue
+            i: int
+            for i in range(len(value)):
+                validate_output_config(variables=variables, errors=errors, output=value[i], index=i)
+        elif key == "plugins":
+            if not isinstance(value, dict):
+                errors.append("plugins: must be a table")
+                continue
+            plugin_name: str
+            for plugin_name, plugin in value.items():
+                validate_plugin_config(variables=variables, errors=errors, plugin_name=plugin_name, plugin=plugin)
+        else:
+            env_var: EnvironmentVariable = EnvironmentVariable.__members__.get(key.upper())
+            if not env_var or env_var.indexed:
+                errors.append(f"unknown key [{key}]")
+            elif env_var in ENVIRONMENT_ONLY_VARIABLES:
+                errors.append(f"[{key}] can only be set in the environment")
+            else:
+                add_config_variable(variables, errors, env_var, env_var.name, value, "settings")
+    return variables
+
+
+def apply_config_file():
+    config_file: str = get_env_variable(env_var=EnvironmentVariable.LAUNCHER_CONFIG_FILE)
+    if config_file:
+        print(f"Reading config file [{config_file}]")
+        common.apply_config_variables(common.load_config_file(
+            file_name=config_file,
+            schema_name=f"mpd-runner-{CONFIG_SCHEMA_VERSION}-{common.get_runner_source_hash('mpd-runner.py')}",
+            validate=validate_config_data))
+
+
+def get_process_tuning() -> common.ProcessTuning:
+    return common.create_process_tuning(
+        cpu_affinity=get_env_variable(env_var=EnvironmentVariable.MPD_CPU_AFFINITY),
+        scheduling_policy=get_env_variable(env_var=EnvironmentVariable.MPD_SCHED_POLICY),
+        scheduling_priority=get_env_variable(env_var=EnvironmentVariable.MPD_SCHED_PRIORITY),
+        memlock=get_env_variable_as_bool(env_var=EnvironmentVariable.MPD_MEMLOCK))
+
+
+def get_restart_policy(environ: dict[str, str] = None) -> common.RestartPolicy:
+    return common.RestartPolicy(
+        initial_delay=int(get_env_variable(env_var=EnvironmentVariable.MPD_RESTART_DELAY, environ=environ)),
+        max_delay=int(get_env_variable(env_var=EnvironmentVariable.MPD_RESTART_MAX_DELAY, environ=environ)),
+        backoff_factor=int(get_env_variable(
+            env_var=EnvironmentVariable.MPD_RESTART_BACKOFF_FACTOR,
+            environ=environ)),
+        jitter_percent=int(get_env_variable(env_var=EnvironmentVariable.MPD_RESTART_JITTER, environ=environ)),
+        stable_uptime=int(get_env_variable(
+            env_var=EnvironmentVariable.MPD_RESTART_STABLE_UPTIME,
+            environ=environ)),
+        crash_loop_max_failures=int(get_env_variable(
+            env_var=EnvironmentVariable.MPD_CRASH_LOOP_MAX_FAILURES,
+            environ=environ)),
+        crash_loop_window=int(get_env_variable(env_var=EnvironmentVariable.MPD_CRASH_LOOP_WINDOW, environ=environ)),
+        crash_loop_action=common.CrashLoopAction(get_env_variable(
+            env_var=EnvironmentVariable.MPD_CRASH_LOOP_ACTION,
+            environ=environ)),
+        crash_loop_cooldown=int(get_env_variable(
+            env_var=EnvironmentVariable.MPD_CRASH_LOOP_COOLDOWN,
+            environ=environ)))
+
+
+def get_log_target() -> LogTarget:
+    return LogTarget(get_env_variable(env_var=EnvironmentVariable.LOG_TARGET))
+
+
 def get_run_mode() -> MpdRunningMode:
     run_mode: str = get_env_variable(env_var=EnvironmentVariable.MPD_RUNNING_MODE)
-    i: MpdRunningMode
-    for i in MpdRunningMode:
-        if i.value.mode_name == run_mode:
-            return i
+    if run_mode in RUNNING_MODE_BY_NAME:
+        return RUNNING_MODE_BY_NAME[run_mode]
     raise NotARunningMode("Invalid mpd running mode")
 
 
+class MpdAddress:
+
+    def __init__(self, host: str = None, port: int = None, socket_path: str = None):
+        self.__host: str = host
+        self.__port: int = port
+        self.__socket_path: str = socket_path
+
+    @property
+    def host(self) -> str:
+        return self.__host
+
+    @property
+    def port(self) -> int:
+        return self.__port
+
+    @property
+    def socket_path(self) -> str:
+        return self.__socket_path
+
+    def __str__(self) -> str:
+        return self.__socket_path if self.__socket_path else f"{self.__host}:{self.__port}"
+
+
+def get_mpd_address() -> MpdAddress:
+    # the first bind address is used to reach mpd
+    bind_address: str = get_env_variable(env_var=EnvironmentVariable.MPD_BIND_ADDRESS).split(",")[0].strip()
+    if bind_address.startswith("/") or bind_address.startswith("~"):
+        return MpdAddress(socket_path=os.path.expanduser(bind_address))
+    host: str = bind_address.strip("[]")
+    if host in ["", "any", "::", "0.0.0.0"]:
+        host = "localhost"
+    return MpdAddress(host=host, port=int(get_env_variable(env_var=EnvironmentVariable.MPD_PORT)))
+
+
+def read_mpd_greeting(address: MpdAddress, timeout: float) -> bool:
+    try:
+        sock: socket.socket
+        if address.socket_path:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(timeout)
+            sock.connect(address.socket_path)
+        else:
+            sock = socket.create_connection((address.host, address.port), timeout=timeout)
+        with sock:
+            greeting: bytes = b""
+            while b"\n" not in greeting:
+                chunk: bytes = sock.recv(64)
+                if not chunk:
+                    break
+                greeting += chunk
+            return greeting.startswith(b"OK MPD")
+    except OSError:
+        return False
+
+
+def wait_for_mpd(
+        address: MpdAddress,
+        timeout: float,
+        is_alive: Callable[[], bool] = lambda: True) -> float:
+    """Poll mpd until it greets, returns the elapsed seconds or None on timeout."""
+    started_at: float = time.monotonic()
+    delay: float = 0.01
+    while time.monotonic() - started_at < timeout and is_alive():
+        if read_mpd_greeting(address=address, timeout=1.0):
+            return time.monotonic() - started_at
+        time.sleep(delay)
+        delay = min(delay * 2, 0.2)
+    return None
+
+
+def run_post_start_commands(address: MpdAddress):
+    indexed_env: IndexedEnvironment = IndexedEnvironment()
+    command_env: dict[str, str] = dict(os.environ)
+    # so that e.g. mpc reaches the right instance
+    command_env["MPD_HOST"] = address.socket_path if address.socket_path else address.host
+    if address.port:
+        command_env["MPD_PORT"] = str(address.port)
+    i: int
+    for i in indexed_env.indexes:
+        command: str = get_indexed_env_variable(
+            env_var=EnvironmentVariable.MPD_POST_START_COMMAND,
+            index=i,
+            indexed_env=indexed_env)
+        if command:
+            print(f"Executing post-start command [{command}] ...", flush=True)
+            res: int = subprocess.call(shlex.split(command), env=command_env)
+            print(f"Post-start command [{command}] returned [{res}]", flush=True)
+
+
+def run_readiness_phase(is_alive: Callable[[], bool] = lambda: True):
+    address: MpdAddress = get_mpd_address()
+    timeout: int = int(get_env_variable(env_var=EnvironmentVariable.MPD_READY_TIMEOUT))
+    print(f"Waiting for mpd at [{address}] ...", flush=True)
+    elapsed: float = wait_for_mpd(address=address, timeout=timeout, is_alive=is_alive)
+    if elapsed is None:
+        print(f"MPD not ready at [{address}] after [{timeout}] seconds, skipping post-start commands", flush=True)
+        return
+    print(f"MPD ready at [{address}] in [{elapsed:.3f}] seconds", flush=True)
+    run_post_start_commands(address=address)
+
+
+def start_readiness_helper():
+    # double fork, so that the helper is not a child of mpd once we exec
+    sys.stdout.flush()
+    pid: int = os.fork()
+    if pid == 0:
+        if os.fork() == 0:
+            try:
+                run_readiness_phase()
+            finally:
+                os._exit(0)
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+
+# maximum wait for mpd to reopen its log file after a rotation
+LOG_REOPEN_TIMEOUT_SECONDS: float = 2.0
+
+
+def rotate_file(file_path: pathlib.Path, rotate_count: int):
+    """Rename file to file.1, shifting the older copies up to file.<rotate_count>."""
+    i: int
+    for i in range(rotate_count - 1, 0, -1):
+        older: pathlib.Path = file_path.with_name(f"{file_path.name}.{i}")
+        if older.exists():
+            os.replace(older, file_path.with_name(f"{file_path.name}.{i + 1}"))
+    os.replace(file_path, file_path.with_name(f"{file_path.name}.1"))
+
+
+class LogMaintenance:
+    """Rotates the log file of mpd by size and copies it from a tmpfs to a persistent directory."""
+
+    def __init__(
+            self,
+            log_file: pathlib.Path,
+            max_size: int,
+            rotate_count: int,
+            check_interval: int,
+            flush_file: pathlib.Path,
+            flush_interval: int):
+        self.__log_file: pathlib.Path = log_file
+        self.__max_size: int = max_size
+        self.__rotate_count: int = max(1, rotate_count)
+        self.__check_interval: int = max(1, check_interval)
+        self.__flush_file: pathlib.Path = flush_file
+        self.__flush_interval: int = flush_interval
+        self.__flushed_offset: int = 0
+        self.__flushed_inode: int = None
+        self.__last_flush: float = time.monotonic()
+        self.__lock: threading.Lock = threading.Lock()
+        self.__stop_event: threading.Event = threading.Event()
+        self.__thread: threading.Thread = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.__max_size or self.__flush_file)
+
+    def __append_new_bytes(self, source: pathlib.Path):
+        # append what mpd wrote since the last flush to the persistent copy, the lock must be held
+        st: os.stat_result = os.stat(source)
+        if st.st_ino != self.__flushed_inode or st.st_size < self.__flushed_offset:
+            # new or truncated log file
+            self.__flushed_inode = st.st_ino
+            self.__flushed_offset = 0
+        if st.st_size > self.__flushed_offset:
+            with open(source, "rb") as src, open(self.__flush_file, "ab") as dst:
+                src.seek(self.__flushed_offset)
+                data: bytes = src.read(st.st_size - self.__flushed_offset)
+                dst.write(data)
+                dst.flush()
+                os.fsync(dst.fileno())
+            self.__flushed_offset += len(data)
+            if self.__max_size and self.__flush_file.stat().st_size >= self.__max_size:
+                rotate_file(file_path=self.__flush_file, rotate_count=self.__rotate_count)
+
+    def flush(self):
+        with self.__lock:
+            try:
+                self.__append_new_bytes(source=self.__log_file)
+            except FileNotFoundError:
+                return
+            self.__last_flush = time.monotonic()
+
+    def __wait_for_reopen(self):
+        # mpd creates the log file again when it reopens it
+        deadline: float = time.monotonic() + LOG_REOPEN_TIMEOUT_SECONDS
+        while not self.__log_file.exists() and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def rotate(self, pid: int):
+        with self.__lock:
+            if self.__flush_file and self.__log_file.exists():
+                self.__append_new_bytes(source=self.__log_file)
+            rotate_file(file_path=self.__log_file, rotate_count=self.__rotate_count)
+            # mpd reopens its log file on SIGHUP
+            os.kill(pid, signal.SIGHUP)
+            if self.__flush_file:
+                # until the log file is reopened, mpd keeps writing to the rotated one,
+                # which is the same inode, so only its tail is copied
+                self.__wait_for_reopen()
+                self.__append_new_bytes(source=self.__log_file.with_name(f"{self.__log_file.name}.1"))
+            self.__flushed_offset = 0
+            self.__flushed_inode = None
+        print(f"Rotated log file [{self.__log_file}]", flush=True)
+
+    def __run(self, pid: int):
+        while not self.__stop_event.wait(self.__check_interval):
+            try:
+                if self.__flush_file and time.monotonic() - self.__last_flush >= self.__flush_interval:
+                    self.flush()
+                if self.__max_size and self.__log_file.exists() and self.__log_file.stat().st_size >= self.__max_size:
+                    self.rotate(pid=pid)
+            except OSError as e:
+                print(f"Log maintenance failed: [{e}]", flush=True)
+
+    def start(self, pid: int):
+        self.__thread = threading.Thread(target=self.__run, args=(pid,), name="log-maintenance", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__stop_event.set()
+        if self.__thread:
+            self.__thread.join()
+        if self.__flush_file:
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Cannot flush log file [{self.__log_file}]: [{e}]", flush=True)
+
+
+def create_log_maintenance(layout: ResolvedLayout) -> LogMaintenance:
+    max_size: str = get_env_variable(env_var=EnvironmentVariable.LOG_MAX_SIZE)
+    flush_directory: str = get_env_variable(env_var=EnvironmentVariable.LOG_FLUSH_DIRECTORY)
+    if (max_size or flush_directory) and not layout.log_file:
+        print("Log maintenance requires a log file, ignoring LOG_MAX_SIZE and LOG_FLUSH_DIRECTORY")
+        return None
+    flush_file: pathlib.Path = None
+    if flush_directory:
+        flush_directory_path: pathlib.Path = pathlib.Path(os.path.expanduser(flush_directory)).absolute()
+        flush_directory_path.mkdir(parents=True, exist_ok=True)
+        flush_file = flush_directory_path.joinpath(layout.log_file.name)
+    return LogMaintenance(
+        log_file=layout.log_file,
+        max_size=parse_size(max_size) if max_size else None,
+        rotate_count=int(get_env_variable(env_var=EnvironmentVariable.LOG_ROTATE_COUNT)),
+        check_interval=int(get_env_variable(env_var=EnvironmentVariable.LOG_CHECK_INTERVAL)),
+        flush_file=flush_file,
+        flush_interval=int(get_env_variable(env_var=EnvironmentVariable.LOG_FLUSH_INTERVAL)))
+
+
 def main():
-    config_file: str = write_config_file()
+    timer: common.PhaseTimer = common.PhaseTimer(
+        runner_name="mpd-runner",
+        enabled=get_env_variable_as_bool(env_var=EnvironmentVariable.LAUNCHER_TIMING),
+        profile_file=get_env_variable(env_var=EnvironmentVariable.LAUNCHER_PROFILE_FILE))
+    apply_config_file()
+    timer.mark("config_file")
+    layout: ResolvedLayout = resolve_layout()
+    timer.mark("resolve_layout")
+    config_file: str = write_config_file(layout=layout, timer=timer)
+    seed_db_file(layout=layout)
+    timer.mark("seed_db")
     print(f"MPD config file name: [{config_file}]")
     subprocess.call(["cat", config_file])
+    timer.mark("show_config")
     mpd_binary: str = get_env_variable(env_var=EnvironmentVariable.MPD_BINARY_PATH)
     print(f"MPD binary: [{mpd_binary}]")
     cmd_line_list: list[str] = [mpd_binary, config_file]
@@ -1092,7 +2258,55 @@ def main():
     if get_env_variable_as_bool(env_var=EnvironmentVariable.MPD_RUN_WITH_VERBOSE):
         cmd_line_list.append("--verbose")
     print(f"Command line: [{cmd_line_list}]")
-    subprocess.call(cmd_line_list)
+    tuning: common.ProcessTuning = get_process_tuning()
+    if tuning.enabled:
+        print(f"Process tuning: {tuning.describe()}")
+    timer.mark("command_line")
+    wait_ready: bool = get_env_variable_as_bool(env_var=EnvironmentVariable.MPD_WAIT_READY)
+    metrics_address: str = get_env_variable(env_var=EnvironmentVariable.MPD_METRICS_ADDRESS)
+    log_maintenance: LogMaintenance = create_log_maintenance(layout=layout)
+    if get_env_variable_as_bool(env_var=EnvironmentVariable.MPD_EXEC_IN_PLACE):
+        if metrics_address:
+            print("Metrics are not available with MPD_EXEC_IN_PLACE, the runner does not stay resident")
+        if log_maintenance and log_maintenance.enabled:
+            print("Log rotation and flush are not available with MPD_EXEC_IN_PLACE, "
+                  "the runner does not stay resident")
+        if wait_ready:
+            start_readiness_helper()
+        # after the readiness helper has been started, it must not inherit these settings
+        tuning.apply()
+        timer.emit()
+        # replace this process with mpd, nothing after this call is executed
+        print("Replacing runner with mpd ...", flush=True)
+        os.execvp(mpd_binary, cmd_line_list)
+    status: common.PlayerStatus = common.PlayerStatus(player_name="mpd")
+    if metrics_address and mpd_running_mode == MpdRunningMode.DAEMON:
+        print("With MPD_RUNNING_MODE daemon, metrics only cover the process that forks mpd")
+    spawn_started_at: float = time.monotonic()
+    # no thread is running yet, so preexec_fn is safe here
+    mpd_process: subprocess.Popen = subprocess.Popen(
+        cmd_line_list,
+        preexec_fn=tuning.apply_in_child if tuning.enabled else None)
+    status.started(pid=mpd_process.pid, spawn_duration=time.monotonic() - spawn_started_at)
+    common.start_metrics_server(address=metrics_address, status=status)
+    timer.mark("spawn")
+    timer.emit()
+    if log_maintenance and log_maintenance.enabled:
+        if mpd_running_mode == MpdRunningMode.DAEMON:
+            print("Log rotation and flush are not available with MPD_RUNNING_MODE daemon")
+            log_maintenance = None
+        else:
+            log_maintenance.start(pid=mpd_process.pid)
+            # stop mpd instead of dying, so that the log is flushed one last time
+            signal.signal(signal.SIGTERM, lambda signum, frame: mpd_process.terminate())
+    if wait_ready:
+        # in daemon mode, the process we started exits as soon as mpd forks
+        run_readiness_phase(is_alive=(lambda: True)
+                            if mpd_running_mode == MpdRunningMode.DAEMON
+                            else lambda: mpd_process.poll() is None)
+    status.terminated(exit_code=mpd_process.wait())
+    if log_maintenance and log_maintenance.enabled:
+        log_maintenance.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import glob
+import os
+import signal
+import sys
+import time
+
+from types import ModuleType
+
+import common
+
+
+class PlayerInstance:
+
+    def __init__(
+            self,
+            name: str,
+            command_line: list[str],
+            environ: dict[str, str],
+            restart_policy: common.RestartPolicy,
+            restart_always: bool,
+            restart_on_fail: bool,
+            tuning: common.ProcessTuning = None):
+        self.__name: str = name
+        self.__command_line: list[str] = command_line
+        self.__environ: dict[str, str] = environ
+        self.__restart_policy: common.RestartPolicy = restart_policy
+        self.__restart_always: bool = restart_always
+        self.__restart_on_fail: bool = restart_on_fail
+        self.__tuning: common.ProcessTuning = tuning
+        self.process: asyncio.subprocess.Process = None
+
+    @property
+    def name(self) -> str:
+        return self.__name
+
+    @property
+    def command_line(self) -> list[str]:
+        return self.__command_line
+
+    @property
+    def environ(self) -> dict[str, str]:
+        return self.__environ
+
+    @property
+    def restart_policy(self) -> common.RestartPolicy:
+        return self.__restart_policy
+
+    @property
+    def restart_always(self) -> bool:
+        return self.__restart_always
+
+    @property
+    def restart_on_fail(self) -> bool:
+        return self.__restart_on_fail
+
+    @property
+    def tuning(self) -> common.ProcessTuning:
+        return self.__tuning
+
+
+def create_squeezelite_instance(sq_runner: ModuleType, name: str, environ: dict[str, str]) -> PlayerInstance:
+    sq_runner.apply_config_file(environ=environ)
+    return PlayerInstance(
+        name=name,
+        command_line=sq_runner.build_command_line(environ=environ),
+        environ=environ,
+        restart_policy=sq_runner.get_restart_policy(environ=environ),
+        restart_always=sq_runner.getenv_as_bool(
+            key=sq_runner.LauncherOption.SQUEEZELITE_RESTART_ALWAYS.var_name,
+            default=sq_runner.LauncherOption.SQUEEZELITE_RESTART_ALWAYS.dflt_value,
+            environ=environ),
+        restart_on_fail=sq_runner.getenv_as_bool(
+            key=sq_runner.LauncherOption.SQUEEZELITE_RESTART_ON_FAIL.var_name,
+            default=sq_runner.LauncherOption.SQUEEZELITE_RESTART_ON_FAIL.dflt_value,
+            environ=environ),
+        tuning=sq_runner.get_process_tuning(environ=environ))
+
+
+def create_mpd_instance(mpd_runner: ModuleType, name: str, environ: dict[str, str]) -> PlayerInstance:
+    # mpd-runner writes the configuration and then replaces itself with mpd,
+    # so no interpreter is left behind for the instance
+    mpd_environ: dict[str, str] = dict(environ)
+    mpd_environ["MPD_EXEC_IN_PLACE"] = "yes"
+    mpd_environ["MPD_RUNNING_MODE"] = "no-daemon"
+    return PlayerInstance(
+        name=name,
+        command_line=[sys.executable, common.get_runner_path("mpd-runner.py")],
+        environ=mpd_environ,
+        restart_policy=mpd_runner.get_restart_policy(environ=environ),
+        restart_always=False,
+        restart_on_fail=True)
+
+
+def load_instance(sq_runner: ModuleType, mpd_runner: ModuleType, env_file: str) -> PlayerInstance:
+    name: str = os.path.splitext(os.path.basename(env_file))[0]
+    environ: dict[str, str] = dict(os.environ)
+    environ.update(common.parse_env_file(env_file))
+    player_type: common.PlayerType = common.get_player_type(environ)
+    print(f"Instance [{name}] from [{env_file}] type [{player_type.value}]")
+    if player_type == common.PlayerType.SQUEEZELITE:
+        return create_squeezelite_instance(sq_runner=sq_runner, name=name, environ=environ)
+    return create_mpd_instance(mpd_runner=mpd_runner, name=name, environ=environ)
+
+
+def load_instances(env_directory: str, pattern: str) -> tuple[list[PlayerInstance], list[str]]:
+    """Instances that can be started, and the env files that could not be loaded."""
+    sq_runner: ModuleType = common.load_runner_module("sq-runner.py")
+    mpd_runner: ModuleType = common.load_runner_module("mpd-runner.py")
+    instances: list[PlayerInstance] = []
+    failed: list[str] = []
+    env_file: str
+    for env_file in sorted(glob.glob(os.path.join(env_directory, pattern))):
+        try:
+            instances.append(load_instance(sq_runner=sq_runner, mpd_runner=mpd_runner, env_file=env_file))
+        except Exception as e:
+            # one broken instance must not stop the others
+            print(f"Cannot load [{env_file}], instance failed: [{type(e).__name__}: {e}]", flush=True)
+            failed.append(env_file)
+    return instances, failed
+
+
+async def forward_output(name: str, stream: asyncio.StreamReader):
+    while True:
+        try:
+            line: bytes = await stream.readuntil(b"\n")
+        except asyncio.IncompleteReadError as e:
+            # end of the output, the last line might have no newline
+            if e.partial:
+                print(f"[{name}] {e.partial.decode(errors='replace').rstrip()}", flush=True)
+            break
+        except asyncio.LimitOverrunError as e:
+            # a line longer than the limit of the reader is forwarded in pieces, so the pipe is still drained
+            line = await stream.read(e.consumed)
+        print(f"[{name}] {line.decode(errors='replace').rstrip()}", flush=True)
+
+
+async def supervise(instance: PlayerInstance, stop_event: asyncio.Event) -> int:
+    res: int = 0
+    while not stop_event.is_set():
+        print(f"[{instance.name}] Executing [{instance.command_line}] ...", flush=True)
+        started_at: float = time.monotonic()
+        try:
+            instance.process = await asyncio.create_subprocess_exec(
+                *instance.command_line,
+                env=instance.environ,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT)
+            if instance.tuning and instance.tuning.enabled:
+                # the event loop can run threads, so no preexec_fn: the settings are applied to the started child,
+                # mpd instances apply their own settings before exec
+                instance.tuning.apply(
+                    report=lambda x: print(f"[{instance.name}] {x}", flush=True),
+                    pid=instance.process.pid)
+            await forward_output(instance.name, instance.process.stdout)
+            res = await instance.process.wait()
+        except OSError as e:
+            print(f"[{instance.name}] Cannot start: [{e}]", flush=True)
+            res = 127
+        finally:
+            instance.process = None
+        uptime: float = time.monotonic() - started_at
+        print(f"[{instance.name}] Result: [{res}] uptime [{uptime:.1f}]", flush=True)
+        if stop_event.is_set():
+            break
+        if not (instance.restart_always or (res != 0 and instance.restart_on_fail)):
+            print(f"[{instance.name}] Start returned [{res}], will not retry.", flush=True)
+            break
+        restart_delay: float = instance.restart_policy.next_delay(uptime=uptime, failed=res != 0)
+        if restart_delay is None:
+            print(f"[{instance.name}] Too many failures, giving up.", flush=True)
+            break
+        print(f"[{instance.name}] Waiting [{restart_delay:.1f}] seconds ...", flush=True)
+        try:
+            # a stop request interrupts the wait
+            await asyncio.wait_for(stop_event.wait(), timeout=restart_delay)
+        except asyncio.TimeoutError:
+            pass
+    return res
+
+
+def request_stop(instances: list[PlayerInstance], stop_event: asyncio.Event):
+    print("Stopping all instances ...", flush=True)
+    stop_event.set()
+    instance: PlayerInstance
+    for instance in instances:
+        if instance.process and instance.process.returncode is None:
+            instance.process.terminate()
+
+
+async def run(instances: list[PlayerInstance]) -> list[int]:
+    stop_event: asyncio.Event = asyncio.Event()
+    loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+    sig: int
+    for sig in [signal.SIGTERM, signal.SIGINT]:
+        loop.add_signal_handler(sig, request_stop, instances, stop_event)
+    return await asyncio.gather(*map(lambda x: supervise(x, stop_event), instances))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run every player described by the env files in a directory from a single process.")
+    parser.add_argument("env_directory", help="Directory containing one env file per player instance")
+    parser.add_argument("--pattern", default="*.env", help="Pattern of the env files (default: *.env)")
+    args = parser.parse_args()
+    instances: list[PlayerInstance]
+    failed: list[str]
+    instances, failed = load_instances(env_directory=args.env_directory, pattern=args.pattern)
+    if not instances and not failed:
+        print(f"No env files matching [{args.pattern}] in [{args.env_directory}]", file=sys.stderr)
+        sys.exit(1)
+    if not instances:
+        print(f"None of the [{len(failed)}] instance(s) could be loaded", file=sys.stderr)
+        sys.exit(1)
+    if failed:
+        print(f"Supervising [{len(instances)}] instance(s), [{len(failed)}] failed: [{failed}]", flush=True)
+    results: list[int] = asyncio.run(run(instances))
+    print(f"All instances terminated, results: [{results}]")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
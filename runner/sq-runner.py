@@ -1,8 +1,14 @@
 #!/usr/bin/env python3
 
 import os
+import sys
 import time
+import re
+import math
+import pathlib
 from enum import Enum
+from typing import Callable
+import common
 import exceptions
 import subprocess
 import shutil
@@ -13,6 +19,14 @@ class VariableName(Enum):
     SQUEEZELITE_RESTART_ALWAYS = "SQUEEZELITE_RESTART_ALWAYS"
     SQUEEZELITE_RESTART_ON_FAIL = "SQUEEZELITE_RESTART_ON_FAIL"
     SQUEEZELITE_RESTART_DELAY = "SQUEEZELITE_RESTART_DELAY"
+    SQUEEZELITE_RESTART_MAX_DELAY = "SQUEEZELITE_RESTART_MAX_DELAY"
+    SQUEEZELITE_RESTART_BACKOFF_FACTOR = "SQUEEZELITE_RESTART_BACKOFF_FACTOR"
+    SQUEEZELITE_RESTART_JITTER = "SQUEEZELITE_RESTART_JITTER"
+    SQUEEZELITE_RESTART_STABLE_UPTIME = "SQUEEZELITE_RESTART_STABLE_UPTIME"
+    SQUEEZELITE_CRASH_LOOP_MAX_FAILURES = "SQUEEZELITE_CRASH_LOOP_MAX_FAILURES"
+    SQUEEZELITE_CRASH_LOOP_WINDOW = "SQUEEZELITE_CRASH_LOOP_WINDOW"
+    SQUEEZELITE_CRASH_LOOP_ACTION = "SQUEEZELITE_CRASH_LOOP_ACTION"
+    SQUEEZELITE_CRASH_LOOP_COOLDOWN = "SQUEEZELITE_CRASH_LOOP_COOLDOWN"
     SQUEEZELITE_SERVER_PORT = "SQUEEZELITE_SERVER_PORT"
     SQUEEZELITE_AUDIO_DEVICE = "SQUEEZELITE_AUDIO_DEVICE"
     SQUEEZELITE_MIXER_DEVICE = "SQUEEZELITE_MIXER_DEVICE"
@@ -22,6 +36,9 @@ class VariableName(Enum):
     SQUEEZELITE_MODEL_NAME = "SQUEEZELITE_MODEL_NAME"
     SQUEEZELITE_PARAMS = "SQUEEZELITE_PARAMS"
     SQUEEZELITE_BUFFER_SIZE = "SQUEEZELITE_BUFFER_SIZE"
+    SQUEEZELITE_BUFFER_SECONDS = "SQUEEZELITE_BUFFER_SECONDS"
+    SQUEEZELITE_BUFFER_BIT_DEPTH = "SQUEEZELITE_BUFFER_BIT_DEPTH"
+    SQUEEZELITE_BUFFER_MAX_MEMORY_PERCENT = "SQUEEZELITE_BUFFER_MAX_MEMORY_PERCENT"
     SQUEEZELITE_VOLUME_CONTROL = "SQUEEZELITE_VOLUME_CONTROL"
     SQUEEZELITE_UNMUTE = "SQUEEZELITE_UNMUTE"
     SQUEEZELITE_VISUALIZER = "SQUEEZELITE_VISUALIZER"
@@ -36,6 +53,18 @@ class VariableName(Enum):
     SQUEEZELITE_READ_FORMATS_FROM_HEADER = "SQUEEZELITE_READ_FORMATS_FROM_HEADER"
     SQUEEZELITE_POWER_SCRIPT = "SQUEEZELITE_POWER_SCRIPT"
     SQUEEZELITE_RPI_GPIO = "SQUEEZELITE_RPI_GPIO"
+    SQUEEZELITE_LOG_LEVEL = "SQUEEZELITE_LOG_LEVEL"
+    SQUEEZELITE_CAPTURE_OUTPUT = "SQUEEZELITE_CAPTURE_OUTPUT"
+    SQUEEZELITE_METRICS_ADDRESS = "SQUEEZELITE_METRICS_ADDRESS"
+    SQUEEZELITE_CPU_AFFINITY = "SQUEEZELITE_CPU_AFFINITY"
+    SQUEEZELITE_SCHED_POLICY = "SQUEEZELITE_SCHED_POLICY"
+    SQUEEZELITE_SCHED_PRIORITY = "SQUEEZELITE_SCHED_PRIORITY"
+    SQUEEZELITE_MEMLOCK = "SQUEEZELITE_MEMLOCK"
+    SQUEEZELITE_EVENTS_FILE = "SQUEEZELITE_EVENTS_FILE"
+    SQUEEZELITE_ENV_FILE = "SQUEEZELITE_ENV_FILE"
+    LAUNCHER_TIMING = "LAUNCHER_TIMING"
+    LAUNCHER_PROFILE_FILE = "LAUNCHER_PROFILE_FILE"
+    LAUNCHER_CONFIG_FILE = "LAUNCHER_CONFIG_FILE"
 
 
 class CommandLineOptionMapperData:
@@ -46,12 +75,14 @@ class CommandLineOptionMapperData:
             cmd_line_option: str,
             dflt_value: str = None,
             boolean_value: bool = False,
-            replace_spaces_with_colon: bool = False):
+            replace_spaces_with_colon: bool = False,
+            auto_value_provider: Callable[[dict[str, str]], str] = None):
         self.__var_name: str = var_name
         self.__cmd_line_option: str = cmd_line_option
         self.__dflt_value: str = dflt_value
         self.__boolean_value: bool = boolean_value
         self.__replace_spaces_with_colon: bool = replace_spaces_with_colon
+        self.__auto_value_provider: Callable[[dict[str, str]], str] = auto_value_provider
 
     @property
     def var_name(self) -> str:
@@ -73,6 +104,10 @@ class CommandLineOptionMapperData:
     def replace_spaces_with_colon(self) -> bool:
         return self.__replace_spaces_with_colon
 
+    @property
+    def auto_value_provider(self) -> Callable[[dict[str, str]], str]:
+        return self.__auto_value_provider
+
 
 class LauncherOptionData:
 
@@ -123,7 +158,8 @@ class CommandLineOptionMapper(Enum):
     SQUEEZELITE_BUFFER_SIZE = CommandLineOptionMapperData(
         var_name=VariableName.SQUEEZELITE_BUFFER_SIZE.value,
         cmd_line_option="-b",
-        replace_spaces_with_colon=True)
+        replace_spaces_with_colon=True,
+        auto_value_provider=lambda environ: get_auto_buffer_size(environ))
     SQUEEZELITE_VOLUME_CONTROL = CommandLineOptionMapperData(
         var_name=VariableName.SQUEEZELITE_VOLUME_CONTROL.value,
         cmd_line_option="-V")
@@ -161,7 +197,7 @@ class CommandLineOptionMapper(Enum):
     SQUEEZELITE_PRIORITY = CommandLineOptionMapperData(
         var_name=VariableName.SQUEEZELITE_PRIORITY.value,
         cmd_line_option="-p",
-        dflt_value=45)
+        dflt_value="45")
     SQUEEZELITE_READ_FORMATS_FROM_HEADER = CommandLineOptionMapperData(
         var_name=VariableName.SQUEEZELITE_READ_FORMATS_FROM_HEADER.value,
         cmd_line_option="-W")
@@ -171,6 +207,9 @@ class CommandLineOptionMapper(Enum):
     SQUEEZELITE_RPI_GPIO = CommandLineOptionMapperData(
         var_name=VariableName.SQUEEZELITE_RPI_GPIO.value,
         cmd_line_option="-G")
+    SQUEEZELITE_LOG_LEVEL = CommandLineOptionMapperData(
+        var_name=VariableName.SQUEEZELITE_LOG_LEVEL.value,
+        cmd_line_option="-d")
 
     @property
     def var_name(self) -> str:
@@ -192,6 +231,10 @@ class CommandLineOptionMapper(Enum):
     def replace_spaces_with_colon(self) -> bool:
         return self.value.replace_spaces_with_colon
 
+    @property
+    def auto_value_provider(self) -> Callable[[dict[str, str]], str]:
+        return self.value.auto_value_provider
+
 
 class LauncherOption(Enum):
     SQUEEZELITE_BINARY_PATH = LauncherOptionData(
@@ -206,6 +249,68 @@ class LauncherOption(Enum):
     SQUEEZELITE_RESTART_DELAY = LauncherOptionData(
         var_name=VariableName.SQUEEZELITE_RESTART_DELAY.value,
         dflt_value="3")
+    SQUEEZELITE_RESTART_MAX_DELAY = LauncherOptionData(
+        var_name=VariableName.SQUEEZELITE_RESTART_MAX_DELAY.value,
+        dflt_value="60")
+    SQUEEZELITE_RESTART_BACKOFF_FACTOR = LauncherOptionData(
+        var_name=VariableName.SQUEEZELITE_RESTART_BACKOFF_FACTOR.value,
+        dflt_value="2")
+    # percentage of the delay, randomly added or subtracted
+    SQUEEZELITE_RESTART_JITTER = LauncherOptionData(
+        var_name=VariableName.SQUEEZELITE_RESTART_JITTER.value,
+        dflt_value="20")
+    # a run lasting at least this many seconds resets the backoff
+    SQUEEZELITE_RESTART_STABLE_UPTIME = LauncherOptionData(
+        var_name=VariableName.SQUEEZELITE_RESTART_STABLE_UPTIME.value,
+        dflt_value="60")
+    # 0 disables the crash-loop breaker
+    SQUEEZELITE_CRASH_LOOP_MAX_FAILURES = LauncherOptionData(
+        var_name=VariableName.SQUEEZELITE_CRASH_LOOP_MAX_FAILURES.value,
+        dflt_value="10")
+    SQUEEZELITE_CRASH_LOOP_WINDOW = LauncherOptionData(
+        var_name=VariableName.SQUEEZELITE_CRASH_LOOP_WINDOW.value,
+        dflt_value="300")
+    SQUEEZELITE_CRASH_LOOP_ACTION = LauncherOptionData(
+        var_name=VariableName.SQUEEZELITE_CRASH_LOOP_ACTION.value,
+        dflt_value=common.CrashLoopAction.COOLDOWN.value)
+    SQUEEZELITE_CRASH_LOOP_COOLDOWN = LauncherOptionData(
+        var_name=VariableName.SQUEEZELITE_CRASH_LOOP_COOLDOWN.value,
+        dflt_value="600")
+    # used when SQUEEZELITE_BUFFER_SIZE is "auto"
+    SQUEEZELITE_BUFFER_SECONDS = LauncherOptionData(
+        var_name=VariableName.SQUEEZELITE_BUFFER_SECONDS.value,
+        dflt_value="10")
+    SQUEEZELITE_BUFFER_BIT_DEPTH = LauncherOptionData(
+        var_name=VariableName.SQUEEZELITE_BUFFER_BIT_DEPTH.value,
+        dflt_value="24")
+    SQUEEZELITE_BUFFER_MAX_MEMORY_PERCENT = LauncherOptionData(
+        var_name=VariableName.SQUEEZELITE_BUFFER_MAX_MEMORY_PERCENT.value,
+        dflt_value="10")
+    SQUEEZELITE_CAPTURE_OUTPUT = LauncherOptionData(
+        var_name=VariableName.SQUEEZELITE_CAPTURE_OUTPUT.value,
+        dflt_value="yes")
+    SQUEEZELITE_EVENTS_FILE = LauncherOptionData(
+        var_name=VariableName.SQUEEZELITE_EVENTS_FILE.value)
+    SQUEEZELITE_ENV_FILE = LauncherOptionData(
+        var_name=VariableName.SQUEEZELITE_ENV_FILE.value)
+    SQUEEZELITE_METRICS_ADDRESS = LauncherOptionData(
+        var_name=VariableName.SQUEEZELITE_METRICS_ADDRESS.value)
+    SQUEEZELITE_CPU_AFFINITY = LauncherOptionData(
+        var_name=VariableName.SQUEEZELITE_CPU_AFFINITY.value)
+    SQUEEZELITE_SCHED_POLICY = LauncherOptionData(
+        var_name=VariableName.SQUEEZELITE_SCHED_POLICY.value)
+    SQUEEZELITE_SCHED_PRIORITY = LauncherOptionData(
+        var_name=VariableName.SQUEEZELITE_SCHED_PRIORITY.value)
+    SQUEEZELITE_MEMLOCK = LauncherOptionData(
+        var_name=VariableName.SQUEEZELITE_MEMLOCK.value,
+        dflt_value="no")
+    LAUNCHER_TIMING = LauncherOptionData(
+        var_name=VariableName.LAUNCHER_TIMING.value,
+        dflt_value="no")
+    LAUNCHER_PROFILE_FILE = LauncherOptionData(
+        var_name=VariableName.LAUNCHER_PROFILE_FILE.value)
+    LAUNCHER_CONFIG_FILE = LauncherOptionData(
+        var_name=VariableName.LAUNCHER_CONFIG_FILE.value)
 
     @property
     def var_name(self) -> str:
@@ -216,6 +321,159 @@ class LauncherOption(Enum):
         return self.value.dflt_value
 
 
+AUTO_BUFFER_FALLBACK_SAMPLE_RATE: int = 192000
+STEREO_CHANNELS: int = 2
+OUTPUT_BUFFER_BYTES_PER_FRAME: int = 8
+# interval of the periodic work while squeezelite runs
+TICK_SECONDS: float = 1.0
+# after a reload, squeezelite is killed if it does not stop in time
+STOP_TIMEOUT_SECONDS: int = 10
+
+
+class LogEvent(Enum):
+    # most of these lines are logged with SQUEEZELITE_LOG_LEVEL at least "output=info"
+    OUTPUT_UNDERRUN = r"underrun"
+    STREAM_BUFFER_FULL = r"buffer full"
+    SAMPLE_RATE_CHANGE = r"track start sample rate: (\d+)"
+    SERVER_CONNECT = r"connecting to"
+    SERVER_CONNECTION_LOST = r"connection dead|connection closed"
+
+
+def write_status(status: common.PlayerStatus, events_file: str):
+    if events_file:
+        common.write_file_atomically(file_path=pathlib.Path(events_file), content=f"{status.to_json()}\n")
+
+
+def forward_line(status: common.PlayerStatus, fd_no: int, line: str):
+    print(line, file=sys.stdout if fd_no == 1 else sys.stderr, flush=True)
+    status.log_events.feed(line)
+
+
+def get_process_tuning(environ: dict[str, str] = None) -> common.ProcessTuning:
+    return common.create_process_tuning(
+        cpu_affinity=getenv(key=LauncherOption.SQUEEZELITE_CPU_AFFINITY.var_name, environ=environ),
+        scheduling_policy=getenv(key=LauncherOption.SQUEEZELITE_SCHED_POLICY.var_name, environ=environ),
+        scheduling_priority=getenv(key=LauncherOption.SQUEEZELITE_SCHED_PRIORITY.var_name, environ=environ),
+        memlock=getenv_as_bool(
+            key=LauncherOption.SQUEEZELITE_MEMLOCK.var_name,
+            default=LauncherOption.SQUEEZELITE_MEMLOCK.dflt_value,
+            environ=environ))
+
+
+def run_player(
+        command_line: list[str],
+        status: common.PlayerStatus,
+        capture: bool,
+        events_file: str = None,
+        timer: common.PhaseTimer = None,
+        watch: Callable[[subprocess.Popen], None] = None) -> int:
+    spawn_started_at: float = time.monotonic()
+    sq_process: subprocess.Popen = subprocess.Popen(
+        command_line,
+        shell=False,
+        stdout=subprocess.PIPE if capture else None,
+        stderr=subprocess.PIPE if capture else None)
+    status.started(pid=sq_process.pid, spawn_duration=time.monotonic() - spawn_started_at)
+    if timer:
+        timer.mark("spawn")
+        timer.emit()
+    if not capture:
+        if not watch:
+            return sq_process.wait()
+        while True:
+            try:
+                return sq_process.wait(timeout=TICK_SECONDS)
+            except subprocess.TimeoutExpired:
+                watch(sq_process)
+    common.pump_process_output(
+        process=sq_process,
+        on_line=lambda fd_no, line: forward_line(status=status, fd_no=fd_no, line=line),
+        on_tick=lambda: on_player_tick(status=status, events_file=events_file, process=sq_process, watch=watch),
+        tick_interval=TICK_SECONDS)
+    return sq_process.wait()
+
+
+def on_player_tick(
+        status: common.PlayerStatus,
+        events_file: str,
+        process: subprocess.Popen,
+        watch: Callable[[subprocess.Popen], None] = None):
+    # at most one write per tick, only when something was counted
+    if status.log_events.take_changed():
+        write_status(status, events_file)
+    if watch:
+        watch(process)
+
+
+class EnvFileReloader:
+    """Rebuilds the command line when the env file changes, squeezelite is stopped only if it is different."""
+
+    def __init__(
+            self,
+            env_file: str,
+            base_environ: dict[str, str],
+            command_line: list[str],
+            environ: dict[str, str],
+            auto_values: dict[str, str]):
+        self.__env_file: str = env_file
+        self.__base_environ: dict[str, str] = base_environ
+        self.__command_line: list[str] = command_line
+        # automatic values of the startup, kept while their inputs do not change
+        self.__auto_inputs: dict[str, str] = get_auto_value_inputs(environ)
+        self.__auto_values: dict[str, str] = auto_values
+        self.__watcher: common.FileWatcher = common.FileWatcher(file_names=[env_file])
+        self.__stop_requested_at: float = None
+
+    @property
+    def command_line(self) -> list[str]:
+        return self.__command_line
+
+    @property
+    def method(self) -> str:
+        return self.__watcher.method
+
+    def refresh(self) -> bool:
+        """Read the env file again if it changed, True if the command line is different."""
+        if not self.__watcher.changed():
+            return False
+        try:
+            # the same steps of the startup, the env file wins over the inherited environment
+            environ: dict[str, str] = dict(self.__base_environ)
+            environ.update(common.parse_env_file(self.__env_file))
+            apply_config_file(environ=environ)
+            # the available memory alone must not change the automatic buffer size
+            auto_inputs: dict[str, str] = get_auto_value_inputs(environ)
+            auto_values: dict[str, str] = dict(self.__auto_values) if auto_inputs == self.__auto_inputs else {}
+            command_line: list[str] = build_command_line(environ=environ, auto_values=auto_values)
+        except Exception as e:
+            print(f"Cannot reload [{self.__env_file}], keeping the current command line: [{e}]", flush=True)
+            return False
+        self.__auto_inputs = auto_inputs
+        self.__auto_values = auto_values
+        if command_line == self.__command_line:
+            print(f"File [{self.__env_file}] changed, the command line is the same", flush=True)
+            return False
+        print(f"File [{self.__env_file}] changed, new command line [{command_line}]", flush=True)
+        self.__command_line = command_line
+        return True
+
+    def check(self, process: subprocess.Popen):
+        if self.__stop_requested_at is not None:
+            if process.poll() is None and time.monotonic() - self.__stop_requested_at > STOP_TIMEOUT_SECONDS:
+                print(f"Squeezelite did not stop in [{STOP_TIMEOUT_SECONDS}] seconds, killing it", flush=True)
+                process.kill()
+            return
+        if self.refresh():
+            print("Stopping squeezelite ...", flush=True)
+            self.__stop_requested_at = time.monotonic()
+            process.terminate()
+
+    def take_restart(self) -> bool:
+        requested: bool = self.__stop_requested_at is not None
+        self.__stop_requested_at = None
+        return requested
+
+
 def yes_no_or_empty(v: str) -> str:
     if not v or (v.lower() in ['yes', 'no']):
         return v.lower() if v else v
@@ -230,21 +488,187 @@ def must_be_int(v: str) -> str:
         raise exceptions.NotAnIntegerValue(f"Value [{v}] is not an integer")
 
 
-def getenv_as_bool(key: str, default: any = None) -> str:
+def must_be_crash_loop_action(v: str) -> str:
+    if v in map(lambda x: x.value, common.CrashLoopAction):
+        return v
+    raise exceptions.NotACrashLoopAction(
+        f"Value [{v}] must be one of {list(map(lambda x: x.value, common.CrashLoopAction))}")
+
+
+# schema version of the config file, the source of the runner is part of the cache key too
+CONFIG_SCHEMA_VERSION: str = "1"
+# variables that only make sense in the environment, not in the config file
+ENVIRONMENT_ONLY_VARIABLES: list[str] = [
+    VariableName.LAUNCHER_CONFIG_FILE.value,
+    VariableName.LAUNCHER_TIMING.value,
+    VariableName.LAUNCHER_PROFILE_FILE.value,
+    VariableName.SQUEEZELITE_ENV_FILE.value]
+
+
+def get_config_validators() -> dict[str, Callable[[str], str]]:
+    validators: dict[str, Callable[[str], str]] = {}
+    mapper: CommandLineOptionMapper
+    for mapper in filter(lambda x: x.boolean_value, CommandLineOptionMapper):
+        validators[mapper.var_name] = yes_no_or_empty
+    option: LauncherOption
+    for option in LauncherOption:
+        if option.dflt_value in ["yes", "no"]:
+            validators[option.var_name] = yes_no_or_empty
+        elif option.dflt_value and option.dflt_value.isdigit():
+            validators[option.var_name] = must_be_int
+    validators[VariableName.SQUEEZELITE_SCHED_PRIORITY.value] = must_be_int
+    validators[VariableName.SQUEEZELITE_CRASH_LOOP_ACTION.value] = must_be_crash_loop_action
+    return validators
+
+
+def validate_config_data(data: dict[str, any], errors: list[str]) -> dict[str, str]:
+    """Convert the content of a config file to variables, collecting all the errors."""
+    validators: dict[str, Callable[[str], str]] = get_config_validators()
+    # e.g. SQUEEZELITE_NAME can be written as squeezelite_name or name
+    names: dict[str, str] = {}
+    vn: VariableName
+    for vn in VariableName:
+        names[vn.value.lower()] = vn.value
+        if vn.value.startswith("SQUEEZELITE_"):
+            names[vn.value[len("SQUEEZELITE_"):].lower()] = vn.value
+    variables: dict[str, str] = {}
+    key: str
+    value: any
+    for key, value in data.items():
+        name: str = names.get(key.lower())
+        if not name:
+            errors.append(f"unknown key [{key}]")
+            continue
+        if name in ENVIRONMENT_ONLY_VARIABLES:
+            errors.append(f"[{key}] can only be set in the environment")
+            continue
+        v: str = common.config_value_to_str(value)
+        if v is None:
+            errors.append(f"value of [{key}] must be a string, a number or a boolean")
+            continue
+        try:
+            if v and name in validators:
+                validators[name](v)
+        except Exception as e:
+            errors.append(f"[{key}] {e}")
+            continue
+        variables[name] = v
+    return variables
+
+
+def apply_config_file(environ: dict[str, str] = None):
+    config_file: str = getenv(key=LauncherOption.LAUNCHER_CONFIG_FILE.var_name, environ=environ)
+    if config_file:
+        print(f"Reading config file [{config_file}]")
+        common.apply_config_variables(
+            variables=common.load_config_file(
+                file_name=config_file,
+                schema_name=f"sq-runner-{CONFIG_SCHEMA_VERSION}-{common.get_runner_source_hash('sq-runner.py')}",
+                validate=validate_config_data),
+            environ=environ)
+
+
+def getenv_as_int(option: LauncherOption, environ: dict[str, str] = None) -> int:
+    return int(must_be_int(getenv(key=option.var_name, default=option.dflt_value, environ=environ)))
+
+
+def get_restart_policy(environ: dict[str, str] = None) -> common.RestartPolicy:
+    return common.RestartPolicy(
+        initial_delay=getenv_as_int(LauncherOption.SQUEEZELITE_RESTART_DELAY, environ),
+        max_delay=getenv_as_int(LauncherOption.SQUEEZELITE_RESTART_MAX_DELAY, environ),
+        backoff_factor=getenv_as_int(LauncherOption.SQUEEZELITE_RESTART_BACKOFF_FACTOR, environ),
+        jitter_percent=getenv_as_int(LauncherOption.SQUEEZELITE_RESTART_JITTER, environ),
+        stable_uptime=getenv_as_int(LauncherOption.SQUEEZELITE_RESTART_STABLE_UPTIME, environ),
+        crash_loop_max_failures=getenv_as_int(LauncherOption.SQUEEZELITE_CRASH_LOOP_MAX_FAILURES, environ),
+        crash_loop_window=getenv_as_int(LauncherOption.SQUEEZELITE_CRASH_LOOP_WINDOW, environ),
+        crash_loop_action=common.CrashLoopAction(must_be_crash_loop_action(getenv(
+            key=LauncherOption.SQUEEZELITE_CRASH_LOOP_ACTION.var_name,
+            default=LauncherOption.SQUEEZELITE_CRASH_LOOP_ACTION.dflt_value,
+            environ=environ))),
+        crash_loop_cooldown=getenv_as_int(LauncherOption.SQUEEZELITE_CRASH_LOOP_COOLDOWN, environ))
+
+
+def getenv_as_bool(key: str, default: any = None, environ: dict[str, str] = None) -> str:
+    dflt_value_str: str = None
     if default and isinstance(default, bool):
         dflt_value_str = "yes" if default else "no"
     elif default and isinstance(default, str):
         dflt_value_str = yes_no_or_empty(default)
-    v: str = yes_no_or_empty(getenv(key, dflt_value_str))
+    v: str = yes_no_or_empty(getenv(key, dflt_value_str, environ))
     return v == "yes"
 
 
-def getenv(key: str, default: str = None) -> str:
-    return os.getenv(key, default)
-
-
-def add_command_line_option(command_line: list[str], mapper: CommandLineOptionMapper) -> list[str]:
-    v: str = getenv(mapper.var_name, mapper.dflt_value)
+def getenv(key: str, default: str = None, environ: dict[str, str] = None) -> str:
+    return (environ if environ is not None else os.environ).get(key, default)
+
+
+def get_max_sample_rate(environ: dict[str, str] = None) -> int:
+    report_max_rate: str = getenv(VariableName.SQUEEZELITE_REPORT_MAX_SAMPLE_RATE.value, None, environ)
+    if report_max_rate:
+        return int(must_be_int(report_max_rate))
+    # -r accepts <maxrate>, <minrate>-<maxrate> or <rate1>,<rate2>,..., optionally followed by :<delay>
+    rates: str = getenv(VariableName.SQUEEZELITE_RATES.value, None, environ)
+    rate_list: list[int] = list(map(
+        lambda x: int(x),
+        filter(lambda x: x.strip().isdigit(), re.split(r"[,-]", rates.split(":")[0])))) if rates else []
+    return max(rate_list) if rate_list else None
+
+
+# variables the automatic values depend on, besides the available memory
+AUTO_VALUE_INPUTS: list[str] = [
+    VariableName.SQUEEZELITE_BUFFER_SIZE.value,
+    VariableName.SQUEEZELITE_BUFFER_SECONDS.value,
+    VariableName.SQUEEZELITE_BUFFER_BIT_DEPTH.value,
+    VariableName.SQUEEZELITE_BUFFER_MAX_MEMORY_PERCENT.value,
+    VariableName.SQUEEZELITE_REPORT_MAX_SAMPLE_RATE.value,
+    VariableName.SQUEEZELITE_RATES.value]
+
+
+def get_auto_value_inputs(environ: dict[str, str] = None) -> dict[str, str]:
+    return dict(map(lambda x: (x, getenv(x, None, environ)), AUTO_VALUE_INPUTS))
+
+
+def get_auto_buffer_size(environ: dict[str, str] = None) -> str:
+    max_rate: int = get_max_sample_rate(environ)
+    if not max_rate:
+        print(f"Max sample rate unknown, assuming [{AUTO_BUFFER_FALLBACK_SAMPLE_RATE}]")
+        max_rate = AUTO_BUFFER_FALLBACK_SAMPLE_RATE
+    seconds: int = getenv_as_int(LauncherOption.SQUEEZELITE_BUFFER_SECONDS, environ)
+    bit_depth: int = getenv_as_int(LauncherOption.SQUEEZELITE_BUFFER_BIT_DEPTH, environ)
+    # the stream buffer holds the stream as received, uncompressed pcm being the worst case
+    stream_kb: int = math.ceil(max_rate * STEREO_CHANNELS * math.ceil(bit_depth / 8) * seconds / 1024)
+    # the output buffer holds decoded frames, always 32 bit per sample in squeezelite
+    output_kb: int = math.ceil(max_rate * OUTPUT_BUFFER_BYTES_PER_FRAME * seconds / 1024)
+    available_kb: int = common.read_meminfo().get("MemAvailable")
+    if available_kb:
+        max_kb: int = available_kb * getenv_as_int(LauncherOption.SQUEEZELITE_BUFFER_MAX_MEMORY_PERCENT, environ) // 100
+        if stream_kb + output_kb > max_kb:
+            # keep the ratio between the two buffers
+            scale: float = max_kb / (stream_kb + output_kb)
+            print(f"Buffers of [{stream_kb + output_kb}] kB exceed [{max_kb}] kB, scaling by [{scale:.2f}]")
+            stream_kb = max(1, int(stream_kb * scale))
+            output_kb = max(1, int(output_kb * scale))
+    else:
+        print("Cannot read MemAvailable, buffer sizes are not limited")
+    print(f"Automatic buffer size for rate [{max_rate}] bit depth [{bit_depth}] "
+          f"seconds [{seconds}]: stream [{stream_kb}] kB output [{output_kb}] kB")
+    return f"{stream_kb}:{output_kb}"
+
+
+def add_command_line_option(
+        command_line: list[str],
+        mapper: CommandLineOptionMapper,
+        environ: dict[str, str] = None,
+        auto_values: dict[str, str] = None) -> list[str]:
+    v: str = getenv(mapper.var_name, mapper.dflt_value, environ)
+    if v and v.lower() == "auto" and mapper.auto_value_provider:
+        if auto_values is not None and mapper.var_name in auto_values:
+            v = auto_values[mapper.var_name]
+            print(f"Keeping automatic value [{v}] for parameter [{mapper.cmd_line_option}] ...")
+        else:
+            v = mapper.auto_value_provider(environ)
+            if auto_values is not None:
+                auto_values[mapper.var_name] = v
     if mapper.boolean_value and v and v.lower() == "yes":
         # add selected flag
         command_line += [ mapper.cmd_line_option ]
@@ -257,39 +681,121 @@ def add_command_line_option(command_line: list[str], mapper: CommandLineOptionMa
     return command_line
 
 
-def main():
+def build_command_line(environ: dict[str, str] = None, auto_values: dict[str, str] = None) -> list[str]:
+    # automatic values found in auto_values are reused, the computed ones are stored there
     # fallback_sq_binary: str = shutil.which(LauncherOption.SQUEEZELITE_BINARY_PATH.value.dflt_value)
     sq_binary: str = getenv(
         key=LauncherOption.SQUEEZELITE_BINARY_PATH.value.var_name,
-        default=LauncherOption.SQUEEZELITE_BINARY_PATH.value.dflt_value)
+        default=LauncherOption.SQUEEZELITE_BINARY_PATH.value.dflt_value,
+        environ=environ)
     print(f"squeezelite runner binary [{sq_binary}]")
     sq_binary = os.path.expanduser(sq_binary)
     which_binary: str = shutil.which(sq_binary)
+    if not which_binary:
+        raise exceptions.BinaryNotFound(f"Cannot find squeezelite binary [{sq_binary}]")
     command_line: list[str] = [os.path.expanduser(which_binary)]
     print(f"squeezelite runner binary -> [{command_line[0]}]")
     mapper: CommandLineOptionMapper
     for mapper in CommandLineOptionMapper:
-        command_line = add_command_line_option(command_line=command_line, mapper=mapper)
+        command_line = add_command_line_option(
+            command_line=command_line,
+            mapper=mapper,
+            environ=environ,
+            auto_values=auto_values)
+    return command_line
+
+
+def main():
+    timer: common.PhaseTimer = common.PhaseTimer(
+        runner_name="sq-runner",
+        enabled=getenv_as_bool(
+            key=LauncherOption.LAUNCHER_TIMING.var_name,
+            default=LauncherOption.LAUNCHER_TIMING.dflt_value),
+        profile_file=getenv(key=LauncherOption.LAUNCHER_PROFILE_FILE.var_name))
+    env_file: str = getenv(key=LauncherOption.SQUEEZELITE_ENV_FILE.var_name)
+    base_environ: dict[str, str] = None
+    if env_file:
+        # the variables of the file must not survive their removal from the file
+        env_file_variables: dict[str, str] = common.parse_env_file(env_file)
+        base_environ = dict(filter(lambda x: x[0] not in env_file_variables, os.environ.items()))
+        os.environ.update(env_file_variables)
+    apply_config_file()
+    timer.mark("config_file")
+    auto_values: dict[str, str] = {}
+    command_line: list[str] = build_command_line(auto_values=auto_values)
+    timer.mark("command_line")
+    reloader: EnvFileReloader = (EnvFileReloader(
+        env_file=env_file,
+        base_environ=base_environ,
+        command_line=command_line,
+        environ=dict(os.environ),
+        auto_values=auto_values)
+        if env_file else None)
+    if reloader:
+        print(f"Watching [{env_file}] with [{reloader.method}]")
     restart_anyway: bool = getenv_as_bool(
         key=LauncherOption.SQUEEZELITE_RESTART_ALWAYS.var_name,
         default=LauncherOption.SQUEEZELITE_RESTART_ALWAYS.dflt_value)
     restart_on_fail: bool = getenv_as_bool(
         key=LauncherOption.SQUEEZELITE_RESTART_ON_FAIL.var_name,
         default=LauncherOption.SQUEEZELITE_RESTART_ON_FAIL.dflt_value)
-    restart_delay: int = int(must_be_int(getenv(
-        key=LauncherOption.SQUEEZELITE_RESTART_DELAY.var_name,
-        default=LauncherOption.SQUEEZELITE_RESTART_DELAY.dflt_value)))
-    print(f"Restart on fail: [{restart_on_fail}] delay: [{restart_delay}]")
+    restart_policy: common.RestartPolicy = get_restart_policy()
+    print(f"Restart on fail: [{restart_on_fail}] "
+          f"delay: [{getenv_as_int(LauncherOption.SQUEEZELITE_RESTART_DELAY)}] "
+          f"max delay: [{getenv_as_int(LauncherOption.SQUEEZELITE_RESTART_MAX_DELAY)}]")
+    capture: bool = getenv_as_bool(
+        key=LauncherOption.SQUEEZELITE_CAPTURE_OUTPUT.var_name,
+        default=LauncherOption.SQUEEZELITE_CAPTURE_OUTPUT.dflt_value)
+    events_file: str = getenv(key=LauncherOption.SQUEEZELITE_EVENTS_FILE.var_name)
+    status: common.PlayerStatus = common.PlayerStatus(
+        player_name="squeezelite",
+        log_events=common.LogEventCounters(patterns=dict(map(lambda x: (x.name.lower(), x.value), LogEvent))))
+    tuning: common.ProcessTuning = get_process_tuning()
+    if tuning.enabled:
+        print(f"Process tuning: {tuning.describe()}")
+        # applied to the runner before any thread starts, squeezelite inherits it on every start
+        tuning.apply()
+    common.start_metrics_server(
+        address=getenv(key=LauncherOption.SQUEEZELITE_METRICS_ADDRESS.var_name),
+        status=status)
+    timer.mark("restart_policy")
+    first_start: bool = True
     while True:
-        print(f"Executing [{command_line}] ...")
-        res: int = subprocess.run(command_line, shell=False)
-        print(f"Result: [{res}] type [{type(res)}] "
-              f"restart_on_fail [{restart_on_fail}] "
-              f"restart_delay [{restart_delay}]")
+        if reloader:
+            command_line = reloader.command_line
+        print(f"Executing [{command_line}] ...", flush=True)
+        started_at: float = time.monotonic()
+        # only the first start is part of the startup timing
+        res: int = run_player(
+            command_line=command_line,
+            status=status,
+            capture=capture,
+            events_file=events_file,
+            timer=timer if first_start else None,
+            watch=reloader.check if reloader else None)
+        first_start = False
+        uptime: float = time.monotonic() - started_at
+        status.terminated(exit_code=res)
+        write_status(status, events_file)
+        print(f"Result: [{res}] "
+              f"uptime [{uptime:.1f}] "
+              f"restart_on_fail [{restart_on_fail}]")
+        print(f"Events: {status.to_json()}")
+        if reloader and reloader.take_restart():
+            # stopped by us, not a failure
+            print("Restarting with the new command line ...")
+            continue
         if (restart_anyway) or (res != 0 and restart_on_fail):
-            # wait the configured amount of time
-            print(f"Waiting [{restart_delay}] seconds ...") 
+            restart_delay: float = restart_policy.next_delay(uptime=uptime, failed=res != 0)
+            if restart_delay is None:
+                print("Too many failures, giving up.")
+                sys.exit(res if res else 1)
+            # wait the computed amount of time
+            print(f"Waiting [{restart_delay:.1f}] seconds ...")
             time.sleep(restart_delay)
+            if reloader:
+                # changes made while squeezelite was not running
+                reloader.refresh()
             print("Retrying ...")
         else:
             print(f"Start returned [{res}], will not retry.")
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "runner"))
+
+import common  # noqa: E402
+
+sq_runner = common.load_runner_module("sq-runner.py")
+
+# canned squeezelite output, the last line has no trailing newline
+STUB_SCRIPT = textwrap.dedent("""\
+    import sys
+    out = sys.stdout
+    err = sys.stderr
+    out.write("[10:00:00.001] slimproto:347 connecting to 192.168.1.10:3483\\n")
+    out.write("[10:00:00.120] process_start:162 track start sample rate: 44100 replay_gain: 0\\n")
+    err.write("[10:00:01.500] _output_frames:118 underrun\\n")
+    err.flush()
+    out.write("[10:00:02.000] stream_thread:341 buffer full\\r\\n")
+    out.write("[10:00:03.000] output_thread:679 nothing to report\\n")
+    out.write("[10:00:04.000] slimproto:790 connection closed\\n")
+    out.write("[10:00:05.000] slimproto:347 connecting to 192.168.1.10:3483\\n")
+    out.write("[10:00:06.000] process_start:162 track start sample rate: 96000 replay_gain: 0")
+    out.flush()
+    """)
+
+
+def run_stub(script: str) -> tuple[common.LogEventCounters, list[tuple[int, str]]]:
+    log_events: common.LogEventCounters = common.LogEventCounters(
+        patterns=dict(map(lambda x: (x.name.lower(), x.value), sq_runner.LogEvent)))
+    lines: list[tuple[int, str]] = []
+
+    def on_line(fd_no: int, line: str):
+        lines.append((fd_no, line))
+        log_events.feed(line)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        stub_file: str = os.path.join(temp_dir, "squeezelite-stub.py")
+        with open(stub_file, "w") as f:
+            f.write(script)
+        process: subprocess.Popen = subprocess.Popen(
+            [sys.executable, stub_file],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE)
+        common.pump_process_output(process=process, on_line=on_line, tick_interval=0.1)
+        process.wait()
+    return log_events, lines
+
+
+class TestLogEvents(unittest.TestCase):
+
+    def test_counters(self):
+        log_events, _ = run_stub(STUB_SCRIPT)
+        self.assertEqual(log_events.counters, {
+            "output_underrun": 1,
+            "stream_buffer_full": 1,
+            "sample_rate_change": 2,
+            "server_connect": 2,
+            "server_connection_lost": 1})
+        self.assertTrue(log_events.take_changed())
+        self.assertFalse(log_events.take_changed())
+
+    def test_last_values(self):
+        log_events, _ = run_stub(STUB_SCRIPT)
+        # taken from the last line, which has no trailing newline
+        self.assertEqual(log_events.last_values, {"sample_rate_change": "96000"})
+
+    def test_lines(self):
+        _, lines = run_stub(STUB_SCRIPT)
+        self.assertEqual(len(lines), 8)
+        self.assertIn((2, "[10:00:01.500] _output_frames:118 underrun"), lines)
+        # carriage returns are removed
+        self.assertIn((1, "[10:00:02.000] stream_thread:341 buffer full"), lines)
+        self.assertEqual(
+            lines[-1],
+            (1, "[10:00:06.000] process_start:162 track start sample rate: 96000 replay_gain: 0"))
+
+    def test_no_events(self):
+        log_events, lines = run_stub("print('[10:00:00.000] output_init_common:390 init output')\n")
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(sum(log_events.counters.values()), 0)
+        self.assertEqual(log_events.last_values, {})
+        self.assertFalse(log_events.take_changed())
+
+
+if __name__ == "__main__":
+    unittest.main()
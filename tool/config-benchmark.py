@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "runner"))
+
+import common  # noqa: E402
+
+DEFAULT_SIZES = "1,10,100,1000"
+DEFAULT_ITERATIONS = 20
+
+
+def read_proc_io():
+    # read/write syscall counters of this process, not available everywhere
+    counters = {}
+    try:
+        with open("/proc/self/io", "r") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                counters[key.strip()] = int(value.strip())
+    except OSError:
+        return None
+    return counters
+
+
+def syscall_delta(before, after):
+    if not before or not after:
+        return None
+    return {k: after[k] - before[k] for k in ["syscr", "syscw"]}
+
+
+def subtract(delta, overhead, key):
+    # reading /proc/self/io is itself a read syscall
+    return max(0, delta[key] - overhead[key]) if delta and overhead else None
+
+
+# values that must be consistent with each other
+SYNTHETIC_VALUES = {
+    "OUTPUT_BUFFER_TIME": "100000",
+    "OUTPUT_PERIOD_TIME": "25000",
+}
+
+
+def synthetic_value(mpd_runner, env_var, index):
+    if env_var.name in SYNTHETIC_VALUES:
+        return SYNTHETIC_VALUES[env_var.name]
+    if env_var.validator is mpd_runner.Validator.YES_NO_OR_EMPTY.value:
+        return "yes"
+    if env_var.validator is mpd_runner.Validator.MUST_BE_INT.value:
+        return str(index + 1)
+    return f"{env_var.name.lower()}_{index}"
+
+
+def build_mpd_environment(mpd_runner, base_directory, output_count):
+    environ = {
+        "MUSIC_DIRECTORY": os.path.join(base_directory, "music"),
+        "PLAYLIST_DIRECTORY": os.path.join(base_directory, "playlist"),
+        "CONFIG_DIRECTORY": os.path.join(base_directory, "config"),
+        "LOG_DIRECTORY": os.path.join(base_directory, "log"),
+        "CACHE_DIRECTORY": base_directory,
+        # every run must render
+        "ENABLE_CONFIG_CACHE": "no",
+        "MPD_BIND_ADDRESS": "0.0.0.0,/run/mpd/socket",
+    }
+    # every plugin, with all of its properties
+    for plugin_type in mpd_runner.PluginType:
+        environ[plugin_type.create_env_var.name] = "yes"
+        for pp in plugin_type.enum_type:
+            environ[pp.env_var.name] = synthetic_value(mpd_runner, pp.env_var, 0)
+    # outputs cycle through all the output types, all properties are set
+    output_types = list(mpd_runner.OutputType)
+    for i in range(output_count):
+        output_type = output_types[i % len(output_types)]
+        suffix = f"_{i + 1}"
+        environ[f"{mpd_runner.EnvironmentVariable.OUTPUT_CREATE.name}{suffix}"] = "yes"
+        environ[f"{mpd_runner.EnvironmentVariable.OUTPUT_TYPE.name}{suffix}"] = output_type.output_type_name
+        environ[f"{mpd_runner.EnvironmentVariable.OUTPUT_NAME.name}{suffix}"] = f"Output {i + 1}"
+        environ[f"{mpd_runner.EnvironmentVariable.OUTPUT_ENABLED.name}{suffix}"] = "yes"
+        for p in output_type.enum_type:
+            environ[f"{p.env_var.name}{suffix}"] = synthetic_value(mpd_runner, p.env_var, i)
+    return environ
+
+
+def build_sq_environment(sq_runner):
+    environ = {}
+    for mapper in sq_runner.CommandLineOptionMapper:
+        environ[mapper.var_name] = "yes" if mapper.boolean_value else f"{mapper.var_name.lower()} value"
+    # any existing binary will do, it is never executed
+    environ[sq_runner.LauncherOption.SQUEEZELITE_BINARY_PATH.var_name] = sys.executable
+    return environ
+
+
+@contextlib.contextmanager
+def replaced_environment(environ):
+    # the runners read os.environ directly
+    saved = dict(os.environ)
+    os.environ.clear()
+    os.environ.update(environ)
+    try:
+        yield
+    finally:
+        os.environ.clear()
+        os.environ.update(saved)
+
+
+def measure(fn, iterations):
+    sink = io.StringIO()
+    durations = []
+    with contextlib.redirect_stdout(sink):
+        for _ in range(iterations):
+            started_at = time.perf_counter()
+            fn()
+            durations.append((time.perf_counter() - started_at) * 1000.0)
+        # allocations and syscalls on a separate run, tracing slows things down
+        io_overhead = syscall_delta(read_proc_io(), read_proc_io())
+        io_before = read_proc_io()
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        io_after = read_proc_io()
+    return {
+        "iterations": iterations,
+        "min_ms": round(min(durations), 4),
+        "median_ms": round(statistics.median(durations), 4),
+        "max_ms": round(max(durations), 4),
+        "peak_alloc_bytes": peak,
+        "read_syscalls": subtract(syscall_delta(io_before, io_after), io_overhead, "syscr"),
+        "write_syscalls": subtract(syscall_delta(io_before, io_after), io_overhead, "syscw"),
+    }
+
+
+def report(result, **fields):
+    fields.update(result)
+    print(json.dumps(fields), flush=True)
+
+
+def benchmark_mpd(mpd_runner, output_count, iterations):
+    with tempfile.TemporaryDirectory(prefix="config-benchmark-") as base_directory:
+        environ = build_mpd_environment(mpd_runner, base_directory, output_count)
+        with replaced_environment(environ):
+            with contextlib.redirect_stdout(io.StringIO()):
+                layout = mpd_runner.resolve_layout()
+                layout.create_directories()
+            phases = [
+                ("resolve_layout", mpd_runner.resolve_layout),
+                ("indexed_environment", mpd_runner.IndexedEnvironment),
+                ("render_config", lambda: mpd_runner.render_config(layout=layout)),
+                ("write_config_file", lambda: mpd_runner.write_config_file(layout=layout)),
+            ]
+            for phase, fn in phases:
+                report(
+                    measure(fn, iterations),
+                    runner="mpd-runner",
+                    phase=phase,
+                    outputs=output_count,
+                    env_size=len(environ))
+
+
+def benchmark_sq(sq_runner, iterations):
+    environ = build_sq_environment(sq_runner)
+    report(
+        measure(lambda: sq_runner.build_command_line(environ=environ), iterations),
+        runner="sq-runner",
+        phase="build_command_line",
+        outputs=None,
+        env_size=len(environ))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the configuration generation of the runners, one JSON line per measurement."
+    )
+    parser.add_argument(
+        "--sizes",
+        default=DEFAULT_SIZES,
+        help=f"Comma separated numbers of mpd outputs (default: {DEFAULT_SIZES})")
+    parser.add_argument(
+        "--iterations",
+        type=int,
+        default=DEFAULT_ITERATIONS,
+        help=f"Timed runs for each measurement (default: {DEFAULT_ITERATIONS})")
+    args = parser.parse_args()
+    try:
+        sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    except ValueError:
+        parser.error(f"invalid sizes '{args.sizes}'")
+    if args.iterations < 1:
+        parser.error("iterations must be at least 1")
+    mpd_runner = common.load_runner_module("mpd-runner.py")
+    sq_runner = common.load_runner_module("sq-runner.py")
+    for output_count in sizes:
+        benchmark_mpd(mpd_runner, output_count, args.iterations)
+    benchmark_sq(sq_runner, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,35 +9,188 @@ except ImportError:
     print("Install it using: pip install python-mpd2", file=sys.stderr)
     sys.exit(1)
 
-def ensure_partition_and_route_output(host, port, target_partition, target_output):
+DEFAULT_PARTITION = "default"
+
+
+def parse_mapping(text):
+    # output names may contain '=', partition names should not
+    partition, sep, output = text.partition("=")
+    if not sep or not partition.strip() or not output.strip():
+        raise ValueError(f"Invalid mapping '{text}', expected 'partition=output'")
+    return partition.strip(), output.strip()
+
+
+def read_mapping_lines(lines):
+    mappings = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        mappings.append(parse_mapping(line))
+    return mappings
+
+
+def collect_mappings(args):
+    # legacy invocation: a single 'partition output' pair
+    if len(args.mappings) == 2 and not any("=" in m for m in args.mappings):
+        return [(args.mappings[0], args.mappings[1])]
+    mappings = []
+    for m in args.mappings:
+        if m == "-":
+            mappings.extend(read_mapping_lines(sys.stdin))
+        else:
+            mappings.append(parse_mapping(m))
+    for file_name in args.file or []:
+        with open(file_name, "r") as f:
+            mappings.extend(read_mapping_lines(f))
+    return mappings
+
+
+def get_partition_names(partitions_raw):
+    existing_partitions = set()
+    for p in partitions_raw:
+        if isinstance(p, dict) and "partition" in p:
+            existing_partitions.add(p["partition"])
+        elif isinstance(p, str):
+            existing_partitions.add(p)
+    return existing_partitions
+
+
+def group_by_partition(mappings):
+    # keeps the order of first appearance, the last mapping of an output wins
+    target_by_output = {}
+    for partition, output in mappings:
+        target_by_output.pop(output, None)
+        target_by_output[output] = partition
+    grouped = {}
+    for output, partition in target_by_output.items():
+        grouped.setdefault(partition, []).append(output)
+    return grouped
+
+
+def fetch_output_locations(client, partitions):
+    # one command list: switch to each partition and list its outputs
+    partitions = sorted(partitions)
+    client.command_list_ok_begin()
+    for partition in partitions:
+        client.partition(partition)
+        client.outputs()
+    # only the outputs responses are lists, one per partition
+    output_lists = [r for r in client.command_list_end() if isinstance(r, list)]
+    location_by_output = {}
+    for partition, outputs in zip(partitions, output_lists):
+        for output in outputs:
+            # outputs living in other partitions are listed as "dummy"
+            if output.get("plugin") != "dummy":
+                location_by_output[output["outputname"]] = partition
+    return location_by_output
+
+
+def compute_changes(existing_partitions, location_by_output, grouped, prune):
+    to_create = [p for p in grouped.keys() if p not in existing_partitions]
+    to_move = {}
+    for partition, outputs in grouped.items():
+        for output in outputs:
+            if location_by_output.get(output) != partition:
+                to_move.setdefault(partition, []).append(output)
+    to_delete = []
+    if prune:
+        moved = set(o for outputs in to_move.values() for o in outputs)
+        for partition in sorted(existing_partitions):
+            if partition == DEFAULT_PARTITION or partition in grouped:
+                continue
+            remaining = [o for o, p in location_by_output.items() if p == partition and o not in moved]
+            if remaining:
+                print(f"Partition '{partition}' still has outputs {remaining}, not deleting it.")
+            else:
+                to_delete.append(partition)
+    return to_create, to_move, to_delete
+
+
+def disconnect(client):
+    # the connection may already be gone, errors are not relevant at this point
+    try:
+        client.disconnect()
+    except Exception:
+        pass
+
+
+def reconcile_mappings(host, port, mappings, prune=False, dry_run=False):
+    client = MPDClient()
+    try:
+        print(f"Connecting to MPD daemon at {host}:{port}...")
+        client.connect(host, port)
+
+        # 1. Fetch the current state: partitions, then the outputs of each partition
+        existing_partitions = get_partition_names(client.listpartitions())
+        location_by_output = fetch_output_locations(client, existing_partitions)
+        grouped = group_by_partition(mappings)
+
+        # 2. Compute the difference with the desired state
+        to_create, to_move, to_delete = compute_changes(existing_partitions, location_by_output, grouped, prune)
+        changes = ([f"create partition '{p}'" for p in to_create] +
+                   [f"move output '{o}' from '{location_by_output.get(o, '?')}' to '{p}'"
+                    for p, outputs in to_move.items() for o in outputs] +
+                   [f"delete partition '{p}'" for p in to_delete])
+        if not changes:
+            print("Nothing to do: outputs are already routed as requested.")
+            return
+        for change in changes:
+            print(f"{'Would ' if dry_run else ''}{change}")
+        if dry_run:
+            return
+
+        # 3. Apply only what is needed, in a single command list
+        client.command_list_ok_begin()
+        for partition in to_create:
+            client.newpartition(partition)
+        for partition, outputs in to_move.items():
+            client.partition(partition)
+            for output in outputs:
+                client.moveoutput(output)
+        if to_delete:
+            # a partition in use by this client cannot be deleted
+            client.partition(DEFAULT_PARTITION)
+            for partition in to_delete:
+                client.delpartition(partition)
+        client.command_list_end()
+        print(f"Success: {len(changes)} change(s) applied successfully.")
+    except CommandError as ce:
+        print(f"MPD Protocol Error: {ce}", file=sys.stderr)
+        sys.exit(2)
+    except Exception as e:
+        print(f"Network/Unexpected Error: {e}", file=sys.stderr)
+        sys.exit(3)
+    finally:
+        disconnect(client)
+
+
+def apply_mappings(host, port, mappings):
     client = MPDClient()
     try:
         print(f"Connecting to MPD daemon at {host}:{port}...")
         client.connect(host, port)
-        
-        # 1. Fetch current active partitions (Fixed method name here)
-        partitions_raw = client.listpartitions()
-        existing_partitions = set()
-        for p in partitions_raw:
-            if isinstance(p, dict) and "partition" in p:
-                existing_partitions.add(p["partition"])
-            elif isinstance(p, str):
-                existing_partitions.add(p)
-
-        # 2. Ensure target partition exists
-        if target_partition not in existing_partitions:
-            print(f"Partition '{target_partition}' does not exist. Creating it...")
-            client.newpartition(target_partition)
-        else:
-            print(f"Partition '{target_partition}' already exists.")
 
-        # 3. Switch client context focus to the target partition
-        client.partition(target_partition)
+        # 1. Fetch current active partitions, one round trip
+        existing_partitions = get_partition_names(client.listpartitions())
+        grouped = group_by_partition(mappings)
 
-        # 4. Move the output into this partition
-        print(f"Routing output '{target_output}' to partition '{target_partition}'...")
-        client.moveoutput(target_output)
-        print("Success: Configuration applied successfully.")
+        # 2. Create the missing partitions and route all the outputs in a single command list
+        client.command_list_ok_begin()
+        for partition in grouped.keys():
+            if partition not in existing_partitions:
+                print(f"Partition '{partition}' does not exist. Creating it...")
+                client.newpartition(partition)
+            else:
+                print(f"Partition '{partition}' already exists.")
+        for partition, outputs in grouped.items():
+            # switch client context focus to the target partition
+            client.partition(partition)
+            for output in outputs:
+                print(f"Routing output '{output}' to partition '{partition}'...")
+                client.moveoutput(output)
+        client.command_list_end()
+        print(f"Success: {len(mappings)} mapping(s) applied successfully.")
     except CommandError as ce:
         print(f"MPD Protocol Error: {ce}", file=sys.stderr)
         sys.exit(2)
@@ -45,22 +198,50 @@ def ensure_partition_and_route_output(host, port, target_partition, target_outpu
         print(f"Network/Unexpected Error: {e}", file=sys.stderr)
         sys.exit(3)
     finally:
-        try:
-            client.disconnect()
-        except:
-            pass
+        disconnect(client)
+
 
 def main():
     parser = argparse.ArgumentParser(
         description="Runtime automation tool to provision MPD partitions and route audio outputs."
     )
     parser.add_argument("--host", default="127.0.0.1", help="MPD server address (default: 127.0.0.1)")
-    parser.add_argument("--port", type=int, default=6600, help="MPD server port (default: 6605)")
-    parser.add_argument("partition", help="Name of the partition to verify/create (e.g., 'oh')")
-    parser.add_argument("output", help="Name or ID of the audio output to route (e.g., 'Out1: DAC')")
+    parser.add_argument("--port", type=int, default=6600, help="MPD server port (default: 6600)")
+    parser.add_argument(
+        "--file",
+        action="append",
+        help="File with one 'partition=output' mapping per line, can be repeated")
+    parser.add_argument(
+        "--reconcile",
+        action="store_true",
+        help="Compare with the current routing and only apply the needed changes")
+    parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="With --reconcile, delete the partitions that are not mapped and have no outputs left")
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="With --reconcile, only report the changes")
+    parser.add_argument(
+        "mappings",
+        nargs="*",
+        help="Mappings as 'partition=output' (e.g., 'oh=Out1: DAC'), '-' reads them from stdin. "
+             "The legacy form 'partition output' is also accepted")
 
     args = parser.parse_args()
-    ensure_partition_and_route_output(args.host, args.port, args.partition, args.output)
+    try:
+        mappings = collect_mappings(args)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    if not mappings:
+        parser.error("no mappings specified")
+    if args.reconcile:
+        reconcile_mappings(args.host, args.port, mappings, prune=args.prune, dry_run=args.dry_run)
+    else:
+        apply_mappings(args.host, args.port, mappings)
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+import argparse
+import concurrent.futures
+import contextlib
+import glob
+import io
+import json
+import os
+import pwd
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "runner"))
+
+import common  # noqa: E402
+import exceptions  # noqa: E402
+
+DEFAULT_PATTERN = "*.env"
+# the PATH of systemd services, used instead of the one of the validating host
+DEFAULT_PATH = "/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin"
+
+# loaded once in each worker process
+runners = {}
+
+
+def load_runners():
+    runners["mpd"] = common.load_runner_module("mpd-runner.py")
+    runners["squeezelite"] = common.load_runner_module("sq-runner.py")
+
+
+def collect_env_files(paths, pattern):
+    env_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            env_files.extend(sorted(glob.glob(os.path.join(path, pattern))))
+        else:
+            env_files.append(path)
+    return env_files
+
+
+def resolve_target_user(user, home):
+    # uid and home directory of the user the players run as, by default the current one
+    if user is None:
+        user = str(os.getuid())
+    try:
+        entry = pwd.getpwuid(int(user)) if user.isdigit() else pwd.getpwnam(user)
+    except KeyError:
+        if not user.isdigit():
+            raise ValueError(f"unknown user '{user}'")
+        entry = None
+    if home is None:
+        if entry is None:
+            raise ValueError(f"no home directory for uid '{user}', use --home")
+        home = entry.pw_dir
+    return (entry.pw_uid if entry else int(user)), home
+
+
+def create_base_environment(home):
+    # only what the player would get from its service, nothing of the validating host
+    return {"HOME": home, "PATH": DEFAULT_PATH}
+
+
+@contextlib.contextmanager
+def replaced_environment(environ):
+    # the mpd runner reads os.environ directly
+    saved = dict(os.environ)
+    os.environ.clear()
+    os.environ.update(environ)
+    try:
+        yield
+    finally:
+        os.environ.clear()
+        os.environ.update(saved)
+
+
+def apply_config_file(runner, environ):
+    # like the runners, but the result is not cached, nothing is written
+    config_file = environ.get("LAUNCHER_CONFIG_FILE")
+    if not config_file:
+        return
+    _, data = common.read_config_file(config_file)
+    errors = []
+    variables = runner.validate_config_data(data, errors)
+    if errors:
+        raise exceptions.InvalidConfigFile(config_file, errors)
+    common.apply_config_variables(variables, environ)
+
+
+def render_mpd(mpd_runner, uid):
+    # the same steps of mpd-runner.py, without creating directories or starting mpd
+    layout = mpd_runner.resolve_layout(uid=uid)
+    config = mpd_runner.render_config(layout=layout)
+    mpd_runner.get_run_mode()
+    mpd_runner.get_process_tuning()
+    return config
+
+
+def render_squeezelite(sq_runner, environ):
+    command_line = sq_runner.build_command_line(environ=environ)
+    sq_runner.get_restart_policy(environ=environ)
+    sq_runner.get_process_tuning(environ=environ)
+    return " ".join(command_line)
+
+
+def validate_env_file(env_file, check_binaries, target_user):
+    result = {"file": env_file, "type": None, "ok": False, "error": None, "render_ms": None, "messages": []}
+    messages = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(messages):
+            uid, home = target_user
+            environ = create_base_environment(home)
+            environ.update(common.parse_env_file(env_file))
+            player_type = common.get_player_type(environ)
+            result["type"] = player_type.value
+            if player_type == common.PlayerType.SQUEEZELITE and not check_binaries:
+                # any existing binary will do, it is never executed
+                environ["SQUEEZELITE_BINARY_PATH"] = sys.executable
+            started_at = time.perf_counter()
+            runner = runners[player_type.value]
+            apply_config_file(runner, environ)
+            with replaced_environment(environ):
+                if player_type == common.PlayerType.SQUEEZELITE:
+                    rendered = render_squeezelite(runner, environ)
+                else:
+                    rendered = render_mpd(runner, uid)
+            result["render_ms"] = round((time.perf_counter() - started_at) * 1000.0, 3)
+            result["rendered_bytes"] = len(rendered)
+            result["ok"] = True
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["messages"] = messages.getvalue().splitlines()
+    return result
+
+
+def print_result(result, verbose):
+    if result["ok"]:
+        print(f"[ok] [{result['file']}] type [{result['type']}] render [{result['render_ms']}] ms")
+    else:
+        print(f"[error] [{result['file']}] type [{result['type']}] {result['error']}")
+    if verbose:
+        for message in result["messages"]:
+            print(f"    {message}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Validate many env files in parallel, rendering each configuration in memory. "
+                    "No directory is created and no player is started."
+    )
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        help="Env files, or directories containing env files")
+    parser.add_argument(
+        "--pattern",
+        default=DEFAULT_PATTERN,
+        help=f"Pattern of the env files in directories (default: {DEFAULT_PATTERN})")
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of worker processes (default: number of cpus)")
+    parser.add_argument(
+        "--check-binaries",
+        action="store_true",
+        help="Also require the squeezelite binary to exist on this host, in the PATH of systemd services")
+    parser.add_argument(
+        "--user",
+        help="User name or uid the players run as (default: the current user)")
+    parser.add_argument(
+        "--home",
+        help="Home directory of that user (default: from the password database)")
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print one JSON line per file")
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Also print the messages of the runners")
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("jobs must be at least 1")
+    try:
+        target_user = resolve_target_user(args.user, args.home)
+    except ValueError as e:
+        parser.error(str(e))
+    env_files = collect_env_files(args.paths, args.pattern)
+    if not env_files:
+        parser.error(f"no env files found matching '{args.pattern}'")
+    started_at = time.perf_counter()
+    failures = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs, initializer=load_runners) as executor:
+        # results are printed in the order of the files
+        for result in executor.map(
+                validate_env_file,
+                env_files,
+                [args.check_binaries] * len(env_files),
+                [target_user] * len(env_files),
+                chunksize=max(1, len(env_files) // (args.jobs * 4))):
+            if not result["ok"]:
+                failures += 1
+            if args.json:
+                print(json.dumps(result), flush=True)
+            else:
+                print_result(result, args.verbose)
+    elapsed = time.perf_counter() - started_at
+    print(f"Validated [{len(env_files)}] file(s) in [{elapsed:.2f}] seconds, [{failures}] with errors",
+          file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()